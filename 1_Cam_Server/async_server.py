@@ -0,0 +1,188 @@
+import asyncio
+
+from aiohttp import web
+from config_loader import load_config
+from logger import setup_logger
+from metrics import CONTENT_TYPE, REGISTRY
+from video_server import multipart_part
+
+# 初始化設定與日誌
+config = load_config()
+logger = setup_logger()
+
+
+class _StreamClient:
+    def __init__(self):
+        self.new_frame = asyncio.Event()
+
+
+class _CameraChannel:
+    def __init__(self, camera):
+        self.camera = camera
+        self.clients = set()
+        self.latest = None
+        self.pump_task = None
+
+
+class AsyncStreamServer:
+    """
+    asyncio (aiohttp) front end for a VideoServer.
+
+    Per camera, one pump task holds a single broadcaster subscription and
+    wakes every connected client when a frame is encoded. Each client always
+    sends the newest frame; while a slow client is still draining its socket,
+    newer frames simply replace the pending one, so nothing is buffered per
+    client and no thread is held per connection.
+    """
+
+    def __init__(self, video_server):
+        """
+        :param video_server: VideoServer providing the camera registry.
+        """
+        self.video_server = video_server
+        self.registry = video_server.registry
+        self.app = web.Application()
+        self._channels = {}
+        # 每台攝影機只有一個 broadcaster 訂閱, 連線數改由此處回報
+        video_server.client_counter = self.client_count
+        self._setup_routes()
+
+    def _setup_routes(self):
+        self.app.router.add_get("/video", self.video_feed)
+        self.app.router.add_get("/video/{cam_id}", self.video_feed)
+        self.app.router.add_get("/snapshot", self.snapshot)
+        self.app.router.add_get("/snapshot/{cam_id}", self.snapshot)
+        self.app.router.add_get("/stats", self.stats)
+        self.app.router.add_get("/metrics", self.metrics)
+
+    async def _pump(self, channel):
+        loop = asyncio.get_running_loop()
+        broadcaster = channel.camera.broadcaster
+        last_seq = 0
+        with broadcaster.subscribe():
+            while channel.clients:
+                # 阻塞等待放到 executor, 每台攝影機只佔用一條等待執行緒
+                encoded = await loop.run_in_executor(
+                    None, broadcaster.wait_for_frame, last_seq, 1.0
+                )
+                if encoded is None:
+                    continue
+                last_seq = encoded.seq
+                channel.latest = encoded
+                for client in channel.clients:
+                    client.new_frame.set()
+        channel.pump_task = None
+
+    def client_count(self, camera):
+        channel = self._channels.get(camera.cam_id)
+        return len(channel.clients) if channel else 0
+
+    def _channel(self, camera):
+        channel = self._channels.get(camera.cam_id)
+        if channel is None:
+            channel = self._channels[camera.cam_id] = _CameraChannel(camera)
+        return channel
+
+    async def video_feed(self, request):
+        cam_id = request.match_info.get("cam_id")
+        camera = self.registry.get(cam_id)
+        if camera is None:
+            raise web.HTTPNotFound(text=f"Unknown camera: {cam_id}")
+        logger.info(f"[{camera.cam_id}] Video feed requested (async)")
+        camera.ensure_running()
+        transport = request.transport
+        peer = transport.get_extra_info("peername") if transport else None
+        pacer = self.video_server.make_pacer(
+            _query_float(request, "fps"),
+            _query_float(request, "max_age_ms"),
+            camera,
+            f"{peer[0]}:{peer[1]}" if peer else request.remote,
+        )
+
+        response = web.StreamResponse(
+            headers={"Content-Type": "multipart/x-mixed-replace; boundary=frame"}
+        )
+        await response.prepare(request)
+
+        channel = self._channel(camera)
+        client = _StreamClient()
+        channel.clients.add(client)
+        if channel.pump_task is None:
+            channel.pump_task = asyncio.create_task(self._pump(channel))
+        last_seq = 0
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(client.new_frame.wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    # 無新畫面時重送最後一張維持連線
+                    jpeg = self.video_server.filler_jpeg(camera)
+                    await response.write(multipart_part(jpeg))
+                    continue
+                client.new_frame.clear()
+
+                # 永遠只取最新的一張, 慢速連線自動跳過中間的 frame
+                encoded = channel.latest
+                if encoded is None or encoded.seq <= last_seq:
+                    continue
+                last_seq = encoded.seq
+
+                delay = pacer.delay(encoded)
+                if delay is None:
+                    continue
+                if delay:
+                    await asyncio.sleep(delay)
+                await response.write(multipart_part(encoded.jpeg))
+                pacer.mark_sent(encoded)
+        except ConnectionResetError:
+            pass
+        finally:
+            channel.clients.discard(client)
+            pacer.close()
+            latency_ms = (pacer.latency or 0.0) * 1000
+            logger.info(
+                f"[{camera.cam_id}] Video feed closed (async): sent {pacer.sent}, "
+                f"dropped {pacer.dropped} stale, latency {latency_ms:.1f} ms"
+            )
+        return response
+
+    async def snapshot(self, request):
+        cam_id = request.match_info.get("cam_id")
+        camera = self.registry.get(cam_id)
+        if camera is None:
+            raise web.HTTPNotFound(text=f"Unknown camera: {cam_id}")
+        # 可能需等待新畫面, 交給 executor 避免阻塞 event loop
+        status, jpeg, headers = await asyncio.get_running_loop().run_in_executor(
+            None,
+            self.video_server.snapshot_result,
+            camera,
+            _query_float(request, "max_age_ms"),
+            request.headers.get("If-None-Match"),
+        )
+        return web.Response(
+            body=jpeg, status=status, headers=headers, content_type="image/jpeg"
+        )
+
+    async def stats(self, request):
+        stats = self.registry.stats()
+        for cam_id, camera in self.registry.cameras.items():
+            stats[cam_id]["subscribers"] = self.client_count(camera)
+        return web.json_response(stats)
+
+    async def metrics(self, request):
+        return web.Response(
+            text=REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE}
+        )
+
+    def run(self):
+        host, port = self.video_server.host, self.video_server.port
+        logger.info(f"Starting asyncio server on {host}:{port}")
+        web.run_app(self.app, host=host, port=port, print=None)
+
+
+def _query_float(request, name):
+    value = request.query.get(name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
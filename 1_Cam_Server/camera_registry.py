@@ -0,0 +1,316 @@
+import os
+import ssl
+import threading
+import time
+
+import av
+import websocket
+from config_loader import load_config
+from decode_policy import DecodePolicy
+from dotenv import load_dotenv
+from frame_broadcaster import FrameBroadcaster, JpegEncoderPool
+from frame_ring import FrameRingWriter
+from logger import setup_logger
+from metrics import (
+    DECODE_ERRORS,
+    DECODE_SECONDS,
+    FRAMES_DECODED,
+    FRAMES_DROPPED,
+    TO_NDARRAY_SECONDS,
+    WS_RECONNECTS,
+)
+from substream import DetectorSubstream
+
+# 初始化設定與日誌
+config = load_config()
+logger = setup_logger()
+
+# 載入 .env 檔案
+load_dotenv()
+
+DEFAULT_CAMERA_ID = "default"
+
+
+class CameraStream:
+    def __init__(
+        self,
+        cam_id,
+        ws_url,
+        origin=None,
+        init_message=None,
+        shm_path=None,
+        decode_fps=0.0,
+        encoder_pool=None,
+        substream=None,
+        frame_rate=0.0,
+    ):
+        """
+        One camera: WebSocket client, HEVC decoder, decode policy, broadcaster
+        and optional shared-memory ring.
+
+        :param cam_id: Camera id used in routes (/video/<cam_id>).
+        :param ws_url: WebSocket streaming URL of the camera.
+        :param origin: Origin header, defaults to CS_WS_ORIGIN.
+        :param init_message: First message after connect, defaults to
+            CS_WS_INIT_MESSAGE.
+        :param shm_path: Path of the shared-memory frame ring, None to disable.
+        :param decode_fps: Output fps of the decode policy, 0 for full rate.
+        :param encoder_pool: JpegEncoderPool shared between cameras.
+        :param substream: Options of a DetectorSubstream (path, width, height,
+            letterbox, planar), None to disable.
+        :param frame_rate: Nominal fps of the camera stream, used to time
+            frames for MJPEG pacing; 0 to use the measured packet rate.
+        """
+        self.cam_id = cam_id
+        self.ws_url = ws_url
+        self.origin = origin or os.getenv("CS_WS_ORIGIN")
+        self.init_message = init_message or os.getenv("CS_WS_INIT_MESSAGE")
+        self.broadcaster = FrameBroadcaster(encoder_pool=encoder_pool, name=cam_id)
+
+        # 共享記憶體輸出 (提供 Human Detector 直接讀取 raw frame, 省去 JPEG/HTTP/解碼)
+        self.frame_ring = None
+        if shm_path:
+            self.frame_ring = FrameRingWriter(
+                shm_path,
+                slot_count=int(os.getenv("CS_SHM_SLOTS", 4)),
+                max_width=int(os.getenv("CS_SHM_MAX_WIDTH", 1920)),
+                max_height=int(os.getenv("CS_SHM_MAX_HEIGHT", 1080)),
+            )
+            logger.info(f"[{cam_id}] Shared-memory frame ring at {shm_path}")
+
+        # 偵測用縮小畫面 (swscale 直接由解碼後的 frame 縮放)
+        self.substream = None
+        if substream and substream.get("path"):
+            self.substream = DetectorSubstream(**substream)
+            logger.info(
+                f"[{cam_id}] Detector substream {self.substream.width}x"
+                f"{self.substream.height} at {substream['path']}"
+            )
+        self.frame_seq = 0
+        # 串流時間 (秒): parse() 出來的 packet/frame 沒有 PTS,
+        # 改以 packet 數 / fps 推算, 供 MJPEG 依來源節奏送出
+        self.frame_rate = frame_rate
+        self.stream_time = 0.0
+
+        self.decoder = av.codec.CodecContext.create("hevc", "r")
+        self.decode_policy = DecodePolicy(target_fps=decode_fps)
+        self._skip_frame = None
+
+        self.stats = {
+            "frames_published": 0,
+            "last_frame_time": None,
+        }
+        # 指標子項目先綁定, 熱路徑上不再查表
+        self.m_decode_seconds = DECODE_SECONDS.labels(camera=cam_id)
+        self.m_to_ndarray_seconds = TO_NDARRAY_SECONDS.labels(camera=cam_id)
+        self.m_frames_decoded = FRAMES_DECODED.labels(camera=cam_id)
+        self.m_rate_limited = FRAMES_DROPPED.labels(camera=cam_id, reason="rate_limit")
+        self.m_decode_errors = DECODE_ERRORS.labels(camera=cam_id)
+        self.m_reconnects = WS_RECONNECTS.labels(camera=cam_id)
+
+        self.ws_thread = threading.Thread(target=self._start_ws_client)
+        self.ws_thread.daemon = True
+        self.ws_started = False
+        self.ws_lock = threading.Lock()  # 避免多次啟動 WS
+
+    def _on_message(self, ws, message):
+        if not isinstance(message, bytes):
+            return
+        try:
+            self.decode_policy.update_demand(self.consumer_count())
+            packets = self.decoder.parse(message)
+            for packet in packets:
+                # 無人訂閱時只 parse 不解碼
+                decode = self.decode_policy.on_packet()
+                rate = self.frame_rate or self.decode_policy.source_fps
+                if rate > 0:
+                    self.stream_time += 1.0 / rate
+                if not decode:
+                    continue
+                self._apply_skip_frame(self.decode_policy.skip_frame())
+                start = time.perf_counter()
+                frames = self.decoder.decode(packet)
+                self.m_decode_seconds.observe(time.perf_counter() - start)
+                for frame in frames:
+                    self.m_frames_decoded.inc()
+                    # 超過目標 fps 的 frame 不做色彩轉換
+                    if not self.decode_policy.should_convert():
+                        self.m_rate_limited.inc()
+                        continue
+                    timestamp = time.time()
+                    self.frame_seq += 1
+                    start = time.perf_counter()
+                    img = frame.to_ndarray(format="bgr24")
+                    self.m_to_ndarray_seconds.observe(time.perf_counter() - start)
+                    self.broadcaster.publish(img, timestamp, self.stream_time)
+                    if self.frame_ring:
+                        self._write_ring(img, timestamp)
+                    if self.substream:
+                        self._write_substream(frame, timestamp)
+                    self.stats["frames_published"] += 1
+                    self.stats["last_frame_time"] = timestamp
+        except av.AVError as e:
+            self.m_decode_errors.inc()
+            logger.error(f"[{self.cam_id}][Decode error] {e}")
+
+    def _start_ws_client(self):
+        def on_open(ws):
+            logger.info(f"[{self.cam_id}][WebSocket Opened] Sending init commands")
+            # DEV: "Basic YWRtaW46YTExMTExMQ=="
+            ws.send(self.init_message)
+            ws.send("vobits=20,pbits=20,aobits=0,hq=1")
+
+        def on_error(ws, error):
+            logger.error(f"[{self.cam_id}][WebSocket Error] {error}")
+
+        def on_close(ws, code, msg):
+            logger.warning(f"[{self.cam_id}][WebSocket Closed] {code}: {msg}")
+
+        logger.info(f"[{self.cam_id}][WebSocket Connecting] to {self.ws_url}")
+        while True:
+            try:
+                ws = websocket.WebSocketApp(
+                    self.ws_url,
+                    header=[
+                        f"Origin: {self.origin}",
+                        "User-Agent: PythonClient/1.0",
+                    ],
+                    on_open=on_open,
+                    on_message=self._on_message,
+                    on_error=on_error,
+                    on_close=on_close,
+                )
+                ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
+            except Exception as e:
+                logger.error(f"[{self.cam_id}][WebSocket Exception] {e}")
+            time.sleep(5)
+            self.m_reconnects.inc()
+
+    def consumer_count(self):
+        return (
+            self.broadcaster.subscriber_count
+            + (1 if self.frame_ring else 0)
+            + (1 if self.substream else 0)
+            + (1 if self.broadcaster.snapshot_demand else 0)
+        )
+
+    def _apply_skip_frame(self, skip_frame):
+        if skip_frame != self._skip_frame:
+            logger.debug(f"[{self.cam_id}][Decode policy] skip_frame={skip_frame}")
+            self.decoder.skip_frame = skip_frame
+            self._skip_frame = skip_frame
+
+    def _write_ring(self, img, timestamp):
+        try:
+            self.frame_ring.write(img, timestamp, self.frame_seq)
+        except ValueError as e:
+            logger.error(f"[{self.cam_id}][Frame ring] {e}")
+
+    def _write_substream(self, frame, timestamp):
+        try:
+            self.substream.write(frame, self.frame_seq, timestamp)
+        except ValueError as e:
+            logger.error(f"[{self.cam_id}][Substream] {e}")
+
+    def ensure_running(self):
+        with self.ws_lock:
+            if not self.ws_started:
+                logger.info(f"[{self.cam_id}] Starting WebSocket thread")
+                self.ws_thread.start()
+                self.ws_started = True
+
+    def stats_snapshot(self):
+        return dict(
+            self.stats,
+            frames_decoded=self.m_frames_decoded.value,
+            decode_errors=self.m_decode_errors.value,
+            reconnects=self.m_reconnects.value,
+            subscribers=self.broadcaster.subscriber_count,
+            source_fps=round(self.decode_policy.source_fps, 2),
+            running=self.ws_started,
+        )
+
+
+class CameraRegistry:
+    """Cameras served by one Cam Server process, sharing the JPEG encoders."""
+
+    def __init__(self, encoder_workers=1):
+        """
+        :param encoder_workers: Encoder threads shared by all cameras.
+        """
+        self.encoder_pool = JpegEncoderPool(workers=encoder_workers)
+        self.cameras = {}
+
+    def add(self, cam_id, ws_url, **options):
+        if cam_id in self.cameras:
+            raise ValueError(f"Duplicate camera id: {cam_id}")
+        camera = CameraStream(cam_id, ws_url, encoder_pool=self.encoder_pool, **options)
+        self.cameras[cam_id] = camera
+        return camera
+
+    def get(self, cam_id=None):
+        """
+        :param cam_id: Camera id, or None for the first registered camera.
+        :return: CameraStream, or None if the id is unknown.
+        """
+        if cam_id is None:
+            return next(iter(self.cameras.values()), None)
+        return self.cameras.get(cam_id)
+
+    def start_shm_cameras(self):
+        # 共享記憶體的讀取端不經過 /video, 需在啟動時就開始接收串流
+        for camera in self.cameras.values():
+            if camera.frame_ring or camera.substream:
+                camera.ensure_running()
+
+    def stats(self):
+        return {
+            cam_id: camera.stats_snapshot() for cam_id, camera in self.cameras.items()
+        }
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the registry from the ``cameras`` section of the YAML config,
+        falling back to a single camera from CS_VIDEO_SOURCE / CS_SHM_PATH.
+        """
+        registry = cls(encoder_workers=int(os.getenv("CS_ENCODER_WORKERS", 1)))
+        decode_fps = float(os.getenv("CS_DECODE_FPS", 0))
+        frame_rate = float(os.getenv("CS_FRAME_RATE", 0))
+        cameras = config.get("cameras") or []
+        if not cameras:
+            registry.add(
+                DEFAULT_CAMERA_ID,
+                os.getenv("CS_VIDEO_SOURCE"),
+                shm_path=os.getenv("CS_SHM_PATH"),
+                decode_fps=decode_fps,
+                substream=_env_substream(),
+                frame_rate=frame_rate,
+            )
+            return registry
+
+        for camera in cameras:
+            registry.add(
+                str(camera["id"]),
+                camera["source"],
+                origin=camera.get("origin"),
+                init_message=camera.get("init_message"),
+                shm_path=camera.get("shm_path"),
+                decode_fps=float(camera.get("decode_fps", decode_fps)),
+                substream=camera.get("substream"),
+                frame_rate=float(camera.get("frame_rate", frame_rate)),
+            )
+        return registry
+
+
+def _env_substream():
+    path = os.getenv("CS_SUB_SHM_PATH")
+    if not path:
+        return None
+    return {
+        "path": path,
+        "width": int(os.getenv("CS_SUB_WIDTH", 416)),
+        "height": int(os.getenv("CS_SUB_HEIGHT", 416)),
+        "letterbox": os.getenv("CS_SUB_LETTERBOX", "true").lower() == "true",
+        "planar": os.getenv("CS_SUB_PLANAR", "true").lower() == "true",
+    }
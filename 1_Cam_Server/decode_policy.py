@@ -0,0 +1,95 @@
+import time
+
+# libav skip_frame 設定值
+SKIP_DEFAULT = "DEFAULT"
+SKIP_NONREF = "NONREF"
+SKIP_NONKEY = "NONKEY"
+
+
+class DecodePolicy:
+    """
+    Decide how much of the incoming HEVC stream is worth decoding.
+
+    - idle: nobody consumes frames, packets are only parsed to stay in sync
+    - resuming: after idling, only key frames are decoded until one arrives
+    - rate-limited: at most ``target_fps`` frames are converted to ndarray,
+      and non-reference frames are skipped inside libav when the source
+      runs well above the target
+    - full: every frame is decoded and converted
+    """
+
+    def __init__(self, target_fps=0.0, nonref_ratio=1.5, fps_smoothing=0.1):
+        """
+        :param target_fps: Output frames per second, 0 for full rate.
+        :param nonref_ratio: Source/target fps ratio above which non-reference
+            frames are skipped by the decoder.
+        :param fps_smoothing: EMA weight used to estimate the source fps.
+        """
+        self.target_fps = target_fps
+        self.nonref_ratio = nonref_ratio
+        self.fps_smoothing = fps_smoothing
+        self.consumers = 0
+        self.source_fps = 0.0
+        self._last_packet_time = None
+        self._next_output_time = 0.0
+        self._waiting_keyframe = True
+
+    @property
+    def idle(self):
+        return self.consumers == 0
+
+    def update_demand(self, consumers, target_fps=None):
+        """
+        Record how many consumers currently want frames.
+
+        :param consumers: Number of active subscribers.
+        :param target_fps: Optional new output fps, 0 for full rate.
+        """
+        if consumers and self.idle:
+            # 閒置後重新開始解碼, 需等待下一張關鍵幀
+            self._waiting_keyframe = True
+        self.consumers = consumers
+        if target_fps is not None:
+            self.target_fps = target_fps
+
+    def on_packet(self, now=None):
+        """
+        Account for one parsed packet and tell whether it should be decoded.
+
+        :return: ``False`` while idling (parse-only), ``True`` otherwise.
+        """
+        now = time.monotonic() if now is None else now
+        if self._last_packet_time is not None:
+            interval = now - self._last_packet_time
+            if interval > 0:
+                self.source_fps += self.fps_smoothing * (
+                    1.0 / interval - self.source_fps
+                )
+        self._last_packet_time = now
+        return not self.idle
+
+    def skip_frame(self):
+        """:return: libav ``skip_frame`` value for the next decode call."""
+        if self._waiting_keyframe:
+            return SKIP_NONKEY
+        if self.target_fps and self.source_fps > self.target_fps * self.nonref_ratio:
+            return SKIP_NONREF
+        return SKIP_DEFAULT
+
+    def should_convert(self, now=None):
+        """
+        Decide whether a decoded frame is converted to ndarray and published.
+        Frames rejected here never pay the colour-conversion cost.
+        """
+        self._waiting_keyframe = False
+        if self.idle:
+            return False
+        if not self.target_fps:
+            return True
+        now = time.monotonic() if now is None else now
+        if now < self._next_output_time:
+            return False
+        # 以排程時間累加, 避免到達時間抖動使實際輸出低於目標 fps
+        period = 1.0 / self.target_fps
+        self._next_output_time = max(self._next_output_time + period, now - period)
+        return True
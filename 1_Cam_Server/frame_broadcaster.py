@@ -0,0 +1,251 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+from config_loader import load_config
+from logger import setup_logger
+from metrics import FRAMES_DROPPED, JPEG_ENCODE_SECONDS
+
+# 初始化設定與日誌
+config = load_config()
+logger = setup_logger()
+
+# 已編碼的 frame: 序號, JPEG, 解碼時的系統時間, 串流時間 (秒, 可能為 None)
+EncodedFrame = namedtuple("EncodedFrame", ["seq", "jpeg", "timestamp", "pts"])
+
+
+class JpegEncoderPool:
+    """
+    Worker threads that JPEG-encode pending frames for any number of
+    broadcasters, so cameras share a fixed encoder budget.
+    """
+
+    def __init__(self, workers=1):
+        """
+        :param workers: Number of encoder threads.
+        """
+        self.workers = workers
+        self._queue = queue.Queue()
+        for i in range(workers):
+            thread = threading.Thread(
+                target=self._work, name=f"jpeg-encoder-{i}", daemon=True
+            )
+            thread.start()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def submit(self, broadcaster):
+        self._queue.put(broadcaster)
+
+    def _work(self):
+        while True:
+            broadcaster = self._queue.get()
+            broadcaster._encode_pending()
+
+
+class FrameBroadcaster:
+    """
+    Encode-once fan-out stage between the decoder and the MJPEG clients.
+
+    The decoder publishes raw BGR frames into a single latest-frame slot, an
+    encoder worker turns each new frame into JPEG exactly once, and every
+    subscriber reads the shared buffer through its own sequence cursor.
+    """
+
+    def __init__(
+        self, jpeg_quality=80, encoder_pool=None, snapshot_hold=10.0, name="default"
+    ):
+        """
+        :param jpeg_quality: JPEG quality (0-100) used for the shared buffer.
+        :param encoder_pool: Shared JpegEncoderPool; a private single-thread
+            pool is created when omitted.
+        :param snapshot_hold: Seconds a snapshot request keeps the decoder busy.
+        :param name: Camera id used as the metrics label.
+        """
+        self.name = name
+        self.jpeg_quality = jpeg_quality
+        self.m_encode_seconds = JPEG_ENCODE_SECONDS.labels(camera=name)
+        self.m_encoder_busy = FRAMES_DROPPED.labels(camera=name, reason="encoder_busy")
+        self.snapshot_hold = snapshot_hold
+        # 區分重啟前後的序號 (ETag 使用)
+        self.epoch = int(time.time())
+        self._snapshot_demand_until = 0.0
+        self.encoder_pool = encoder_pool or JpegEncoderPool(workers=1)
+        self._params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+
+        # 解碼端 -> 編碼端: 只保留最新一張 raw frame
+        self._raw_lock = threading.Lock()
+        self._raw_frame = None
+        self._raw_meta = (0.0, None)
+        self._raw_seq = 0
+        self._subscribers = 0
+        self._encode_scheduled = False
+
+        # 編碼端 -> 訂閱端: 最新的 JPEG 與其序號
+        self._jpeg_cond = threading.Condition()
+        self._encoded = None
+        self._jpeg_seq = 0
+
+    @property
+    def subscriber_count(self):
+        return self._subscribers
+
+    def publish(self, frame, timestamp=None, pts=None):
+        """
+        Replace the pending raw frame; older unencoded frames are dropped.
+
+        :param frame: Decoded BGR frame.
+        :param timestamp: Wall-clock decode time, defaults to now.
+        :param pts: Stream time of the frame in seconds (frame count over the
+            source fps), if known.
+        """
+        with self._raw_lock:
+            # 尚未編碼就被覆蓋的 frame (編碼跟不上解碼)
+            if self._encode_scheduled:
+                self.m_encoder_busy.inc()
+            self._raw_frame = frame
+            self._raw_meta = (timestamp or time.time(), pts)
+            self._raw_seq += 1
+            schedule = self._should_schedule()
+        if schedule:
+            self.encoder_pool.submit(self)
+
+    @property
+    def snapshot_demand(self):
+        """Whether a snapshot was requested within the last ``snapshot_hold``."""
+        return time.monotonic() < self._snapshot_demand_until
+
+    def _should_schedule(self, force=False):
+        # 需持有 _raw_lock; 每個 broadcaster 同時最多一個編碼工作
+        # 沒有訂閱者時不編碼, 避免空轉 CPU (snapshot 以 force 單次編碼)
+        if self._encode_scheduled or (self._subscribers == 0 and not force):
+            return False
+        if self._raw_frame is None or self._raw_seq == self._jpeg_seq:
+            return False
+        self._encode_scheduled = True
+        return True
+
+    def _encode_pending(self):
+        with self._raw_lock:
+            frame = self._raw_frame
+            timestamp, pts = self._raw_meta
+            seq = self._raw_seq
+
+        try:
+            start = time.perf_counter()
+            ok, buffer = cv2.imencode(".jpg", frame, self._params)
+            self.m_encode_seconds.observe(time.perf_counter() - start)
+            if not ok:
+                raise ValueError("cv2.imencode returned no data")
+        except Exception as e:
+            logger.error(f"Frame encoding error: {e}")
+        else:
+            with self._jpeg_cond:
+                self._encoded = EncodedFrame(seq, buffer.tobytes(), timestamp, pts)
+                self._jpeg_seq = seq
+                self._jpeg_cond.notify_all()
+
+        # 編碼期間若已有更新的 frame, 重新排入編碼佇列
+        with self._raw_lock:
+            self._encode_scheduled = False
+            schedule = self._raw_seq != seq and self._should_schedule()
+        if schedule:
+            self.encoder_pool.submit(self)
+
+    def wait_for_frame(self, last_seq, timeout=1.0):
+        """
+        Block until a frame newer than ``last_seq`` has been encoded.
+
+        :param last_seq: Sequence number the caller has already consumed.
+        :param timeout: Maximum seconds to wait.
+        :return: The newest EncodedFrame, or ``None`` on timeout.
+        """
+        with self._jpeg_cond:
+            if not self._jpeg_cond.wait_for(
+                lambda: self._jpeg_seq > last_seq, timeout=timeout
+            ):
+                return None
+            return self._encoded
+
+    def latest(self):
+        """:return: The most recently encoded EncodedFrame, or ``None``."""
+        return self._encoded
+
+    def snapshot(self, max_age=None, timeout=1.0, poll_interval=0.05):
+        """
+        Return the cached JPEG of the newest frame for one-shot consumers.
+
+        The cached buffer is reused as long as it satisfies ``max_age``;
+        otherwise the newest raw frame is encoded once (shared by all
+        concurrent callers) and returned.
+
+        :param max_age: Maximum seconds since decode, None for any age.
+        :param timeout: Maximum seconds to wait for a fresh enough frame.
+        :return: EncodedFrame, or ``None`` if none is fresh enough in time.
+        """
+        self._snapshot_demand_until = time.monotonic() + self.snapshot_hold
+        deadline = time.monotonic() + timeout
+        encoded = self._encoded
+        while True:
+            if encoded is not None and (
+                max_age is None or time.time() - encoded.timestamp <= max_age
+            ):
+                return encoded
+
+            with self._raw_lock:
+                schedule = self._should_schedule(force=True)
+            if schedule:
+                self.encoder_pool.submit(self)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            last_seq = encoded.seq if encoded else 0
+            encoded = (
+                self.wait_for_frame(last_seq, min(remaining, poll_interval)) or encoded
+            )
+
+    def subscribe(self):
+        return FrameSubscriber(self)
+
+    def _add_subscriber(self):
+        with self._raw_lock:
+            self._subscribers += 1
+            # 新訂閱者加入時, 立即編碼手上最新的一張
+            schedule = self._should_schedule()
+        if schedule:
+            self.encoder_pool.submit(self)
+
+    def _remove_subscriber(self):
+        with self._raw_lock:
+            self._subscribers -= 1
+
+
+class FrameSubscriber:
+    """Per-client cursor over a FrameBroadcaster with latest-frame semantics."""
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+        self.last_seq = 0
+
+    def __enter__(self):
+        self.broadcaster._add_subscriber()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.broadcaster._remove_subscriber()
+        return False
+
+    def next_frame(self, timeout=1.0):
+        """
+        Return the newest EncodedFrame after this cursor, skipping any frames
+        missed while the client was busy, or ``None`` if nothing arrived.
+        """
+        encoded = self.broadcaster.wait_for_frame(self.last_seq, timeout)
+        if encoded is not None:
+            self.last_seq = encoded.seq
+        return encoded
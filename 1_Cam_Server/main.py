@@ -1,5 +1,6 @@
 import os
 
+from camera_registry import CameraRegistry
 from config_loader import (
     load_config,
 )
@@ -16,13 +17,18 @@ def main():
     logger = setup_logger()
     logger.info(f"Starting {config['app']['name']} v{config['app']['version']}")
 
-    # 從 .env 檔案中讀取配置
-    source_url = os.getenv("CS_VIDEO_SOURCE")
+    # 從 .env 檔案中讀取配置, 多台攝影機時由設定檔 cameras 區段指定
     port = int(os.getenv("CS_SERVER_PORT"))
-    server = VideoServer(ws_url=source_url, host="0.0.0.0", port=port)
-    logger.info(f"source_url {source_url} on port {port}")
-    logger.info(f"Starting VideoServer application from {source_url} on port {port}")
-    server.run()
+    registry = CameraRegistry.from_config(config)
+    server = VideoServer(host="0.0.0.0", port=port, registry=registry)
+    for cam_id, camera in registry.cameras.items():
+        logger.info(f"Camera {cam_id}: {camera.ws_url} -> /video/{cam_id}")
+    logger.info(f"Starting VideoServer application on port {port}")
+    # 服務模式: flask (每個連線一條執行緒) 或 async (單一 event loop)
+    if os.getenv("CS_SERVER_MODE", "flask") == "async":
+        server.run_async()
+    else:
+        server.run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,255 @@
+import threading
+import time
+from bisect import bisect_left
+
+# Prometheus 文字格式的輕量指標 (不依賴 prometheus_client)
+# `+=` 並非原子操作, 同一個子指標可能由多個用戶端執行緒同時更新
+# (例如 FRAMES_SENT / FRAMES_DROPPED), 更新時取各自的鎖 (無競爭時成本極低)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 秒; 涵蓋 Pi 上單張 frame 解碼/轉換/編碼的常見範圍
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricFamily:
+    def __init__(self, name, documentation, metric_type, factory, labelnames=()):
+        """
+        :param name: Metric name.
+        :param documentation: HELP text.
+        :param metric_type: counter, gauge or histogram.
+        :param factory: Callable creating one child metric.
+        :param labelnames: Names of the labels of this family.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.factory = factory
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self.factory())
+        return child
+
+    def remove(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._children.pop(key, None)
+
+    def samples(self):
+        return list(self._children.items())
+
+
+class CallbackGauge:
+    def __init__(self, name, documentation, labelnames, callback):
+        """
+        Gauge evaluated at scrape time instead of on the hot path.
+
+        :param callback: Returns ``{label_values_tuple: value}``.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = "gauge"
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def samples(self):
+        return [
+            (tuple(map(str, key)), _Value(value))
+            for key, value in self.callback().items()
+        ]
+
+
+class _Value:
+    def __init__(self, value):
+        self.value = value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(
+            MetricFamily(name, documentation, "counter", Counter, labelnames)
+        )
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(
+            MetricFamily(name, documentation, "gauge", Gauge, labelnames)
+        )
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(
+            MetricFamily(
+                name, documentation, "histogram", lambda: Histogram(buckets), labelnames
+            )
+        )
+
+    def callback_gauge(self, name, documentation, labelnames, callback):
+        self._metrics.pop(name, None)
+        return self._register(CallbackGauge(name, documentation, labelnames, callback))
+
+    def render(self):
+        """:return: All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            for key, child in metric.samples():
+                labels = dict(zip(metric.labelnames, key))
+                if metric.metric_type == "histogram":
+                    lines.extend(_render_histogram(metric.name, labels, child))
+                else:
+                    name = f"{metric.name}{_format_labels(labels)}"
+                    lines.append(f"{name} {_format_value(child.value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _render_histogram(name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        bucket_labels = dict(labels, le=_format_value(bound))
+        yield f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}"
+    cumulative += histogram.counts[-1]
+    yield f"{name}_bucket{_format_labels(dict(labels, le='+Inf'))} {cumulative}"
+    yield f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}"
+    yield f"{name}_count{_format_labels(labels)} {histogram.count}"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+# Cam Server 管線指標
+REGISTRY = MetricsRegistry()
+
+DECODE_SECONDS = REGISTRY.histogram(
+    "cam_decode_seconds", "HEVC packet decode latency.", ["camera"]
+)
+TO_NDARRAY_SECONDS = REGISTRY.histogram(
+    "cam_to_ndarray_seconds",
+    "Decoded frame to BGR ndarray conversion time.",
+    ["camera"],
+)
+JPEG_ENCODE_SECONDS = REGISTRY.histogram(
+    "cam_jpeg_encode_seconds", "Shared JPEG encode time per frame.", ["camera"]
+)
+STREAM_LATENCY_SECONDS = REGISTRY.histogram(
+    "cam_stream_latency_seconds",
+    "Decode-to-send latency of MJPEG frames.",
+    ["camera"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+FRAMES_DECODED = REGISTRY.counter(
+    "cam_frames_decoded_total", "Frames produced by the decoder.", ["camera"]
+)
+FRAMES_DROPPED = REGISTRY.counter(
+    "cam_frames_dropped_total",
+    "Frames dropped (rate_limit, encoder_busy, stale).",
+    ["camera", "reason"],
+)
+FRAMES_SENT = REGISTRY.counter(
+    "cam_frames_sent_total", "MJPEG frames sent to clients.", ["camera"]
+)
+FILLER_FRAMES = REGISTRY.counter(
+    "cam_filler_frames_total",
+    "Keepalive frames sent without a new frame (repeat, black).",
+    ["camera", "kind"],
+)
+DECODE_ERRORS = REGISTRY.counter(
+    "cam_decode_errors_total", "Decoder errors.", ["camera"]
+)
+WS_RECONNECTS = REGISTRY.counter(
+    "cam_ws_reconnects_total", "WebSocket reconnect attempts.", ["camera"]
+)
+CLIENT_FPS = REGISTRY.gauge(
+    "cam_client_fps",
+    "Frames per second sent to each MJPEG client.",
+    ["camera", "client"],
+)
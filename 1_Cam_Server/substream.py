@@ -0,0 +1,91 @@
+import numpy as np
+from frame_ring import (
+    FLAG_LETTERBOX,
+    FLAG_PLANAR,
+    FLAG_RGB,
+    FrameRingWriter,
+    letterbox_geometry,
+)
+
+
+class DetectorSubstream:
+    def __init__(
+        self,
+        path,
+        width=416,
+        height=416,
+        letterbox=True,
+        planar=True,
+        slot_count=4,
+        pad_value=127,
+    ):
+        """
+        Inference-ready copy of the decoded stream, scaled by libav (swscale)
+        straight from the decoded frame into a shared-memory ring.
+
+        Frames are RGB; sequence numbers match the camera's full-resolution
+        ring so a detector can fetch the full frame of a hit by sequence.
+
+        :param path: Ring file of the substream, normally under /dev/shm.
+        :param width: Detector input width.
+        :param height: Detector input height.
+        :param letterbox: Keep the aspect ratio and pad instead of stretching.
+        :param planar: Store frames as CHW planes instead of interleaved HWC.
+        :param slot_count: Number of frames kept in the ring.
+        :param pad_value: Grey level of the letterbox padding.
+        """
+        self.width = width
+        self.height = height
+        self.letterbox = letterbox
+        self.planar = planar
+        flags = FLAG_RGB
+        if letterbox:
+            flags |= FLAG_LETTERBOX
+        if planar:
+            flags |= FLAG_PLANAR
+        self.ring = FrameRingWriter(
+            path,
+            slot_count=slot_count,
+            max_width=width,
+            max_height=height,
+            flags=flags,
+        )
+        # 預先配置的畫布, 每張 frame 重複使用
+        self.pad_value = pad_value
+        self._canvas = np.full((height, width, 3), pad_value, dtype=np.uint8)
+        self._planes = np.empty((3, height, width), dtype=np.uint8)
+        self._geometry = None
+
+    def write(self, frame, seq=None, timestamp=None):
+        """
+        Scale one decoded frame and publish it.
+
+        :param frame: av.VideoFrame straight from the decoder.
+        :param seq: Sequence number shared with the full-resolution ring.
+        :param timestamp: Decode time in epoch seconds.
+        """
+        if self.letterbox:
+            if self._geometry is None or self._geometry[0] != (
+                frame.width,
+                frame.height,
+            ):
+                geometry = letterbox_geometry(
+                    frame.width, frame.height, self.width, self.height
+                )
+                self._geometry = ((frame.width, frame.height), geometry)
+                self._canvas[:] = self.pad_value
+            _, pad_x, pad_y, width, height = self._geometry[1]
+            scaled = frame.reformat(width=width, height=height, format="rgb24")
+            self._canvas[pad_y : pad_y + height, pad_x : pad_x + width] = (
+                scaled.to_ndarray()
+            )
+            image = self._canvas
+        else:
+            image = frame.reformat(
+                width=self.width, height=self.height, format="rgb24"
+            ).to_ndarray()
+
+        if self.planar:
+            np.copyto(self._planes, image.transpose(2, 0, 1))
+            image = self._planes
+        return self.ring.write(image, timestamp, seq)
@@ -1,16 +1,22 @@
+import os
 import time
-import threading
-import queue
+
 import cv2
 import numpy as np
-import websocket
-import ssl
-import av
-import os
-from flask import Flask, Response
+from camera_registry import CameraRegistry
 from config_loader import load_config
-from logger import setup_logger
 from dotenv import load_dotenv
+from flask import Flask, Response, abort, jsonify, request
+from logger import setup_logger
+from metrics import (
+    CLIENT_FPS,
+    CONTENT_TYPE,
+    FILLER_FRAMES,
+    FRAMES_DROPPED,
+    FRAMES_SENT,
+    REGISTRY,
+    STREAM_LATENCY_SECONDS,
+)
 
 # 初始化設定與日誌
 config = load_config()
@@ -19,114 +25,329 @@ logger = setup_logger()
 # 載入 .env 檔案
 load_dotenv()
 
+
+class FramePacer:
+    """
+    Per-client send pacing driven by frame timestamps instead of a fixed sleep.
+
+    Frames older than ``max_age`` are dropped, a frame is delayed only as far
+    as the ``max_fps`` cap or the source frame spacing requires, and the
+    decode-to-send latency of every sent frame is tracked.
+    """
+
+    def __init__(
+        self,
+        max_fps=0.0,
+        max_age=0.5,
+        latency_smoothing=0.1,
+        camera="default",
+        client=None,
+    ):
+        """
+        :param max_fps: Upper bound on frames per second, 0 for source rate.
+        :param max_age: Seconds after decode when a frame is considered stale,
+            0 to never drop.
+        :param latency_smoothing: EMA weight of the latency and fps estimates.
+        :param camera: Camera id used as the metrics label.
+        :param client: Client address; enables the per-client fps gauge.
+        """
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.max_age = max_age
+        self.latency_smoothing = latency_smoothing
+        self.camera = camera
+        self.client = client
+        self.latency = None
+        self.fps = 0.0
+        self.sent = 0
+        self.dropped = 0
+        self._last_sent = None
+        self._last_pts = None
+        self.m_stale = FRAMES_DROPPED.labels(camera=camera, reason="stale")
+        self.m_sent = FRAMES_SENT.labels(camera=camera)
+        self.m_latency = STREAM_LATENCY_SECONDS.labels(camera=camera)
+        self.m_fps = CLIENT_FPS.labels(camera=camera, client=client) if client else None
+
+    def delay(self, encoded, now=None):
+        """
+        :return: Seconds to wait before sending ``encoded``, or ``None`` if the
+            frame is stale and should be dropped.
+        """
+        now = time.time() if now is None else now
+        if self.max_age and now - encoded.timestamp > self.max_age:
+            self.dropped += 1
+            self.m_stale.inc()
+            return None
+        if self._last_sent is None:
+            return 0.0
+
+        due = self._last_sent + self.min_interval
+        # 依串流時間 (frame 數 / 來源 fps) 的間隔送出, 平滑突發到達的 frame
+        if (
+            encoded.pts is not None
+            and self._last_pts is not None
+            and encoded.pts > self._last_pts
+        ):
+            due = max(due, self._last_sent + (encoded.pts - self._last_pts))
+        # 延遲不可讓 frame 超過新鮮度上限
+        if self.max_age:
+            due = min(due, encoded.timestamp + self.max_age)
+        return max(0.0, due - now)
+
+    def mark_sent(self, encoded, now=None):
+        now = time.time() if now is None else now
+        if self._last_sent is not None and now > self._last_sent:
+            self.fps += self.latency_smoothing * (
+                1.0 / (now - self._last_sent) - self.fps
+            )
+            if self.m_fps:
+                self.m_fps.set(round(self.fps, 2))
+        self._last_sent = now
+        self._last_pts = encoded.pts
+        self.sent += 1
+        self.m_sent.inc()
+        latency = now - encoded.timestamp
+        self.m_latency.observe(latency)
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.latency_smoothing * (latency - self.latency)
+
+    def close(self):
+        if self.client:
+            CLIENT_FPS.remove(camera=self.camera, client=self.client)
+
+
+def multipart_part(jpeg):
+    """Wrap one JPEG as a multipart/x-mixed-replace part."""
+    return (
+        b"--frame\r\n"
+        b"Content-Type: image/jpeg\r\n"
+        + f"Content-Length: {len(jpeg)}\r\n\r\n".encode()
+        + jpeg
+        + b"\r\n"
+    )
+
+
+def _black_jpeg(width=640, height=480):
+    _, buffer = cv2.imencode(".jpg", np.zeros((height, width, 3), dtype=np.uint8))
+    return buffer.tobytes()
+
+
 class VideoServer:
-    def __init__(self, ws_url, host="0.0.0.0", port=8080):
-        self.ws_url = ws_url
+    def __init__(
+        self, ws_url=None, host="0.0.0.0", port=8080, shm_path=None, registry=None
+    ):
+        """
+        :param ws_url: Single camera source, used when no registry is given.
+        :param host: Bind address.
+        :param port: Bind port.
+        :param shm_path: Shared-memory ring of the single camera.
+        :param registry: CameraRegistry serving several cameras.
+        """
         self.host = host
         self.port = port
         self.app = Flask(__name__)
-        self.frame_queue = queue.Queue(maxsize=10)
-        self.decoder = av.codec.CodecContext.create('hevc', 'r')
-        self.ws_thread = threading.Thread(target=self._start_ws_client)
-        self.ws_thread.daemon = True
-        self.ws_started = False
-        self.ws_lock = threading.Lock()  # 避免多次啟動 WS
+        if registry is None:
+            registry = CameraRegistry()
+            registry.add(
+                "default",
+                ws_url,
+                shm_path=shm_path,
+                decode_fps=float(os.getenv("CS_DECODE_FPS", 0)),
+            )
+        self.registry = registry
+        self.black_jpeg = _black_jpeg()
+        # asyncio 模式由 AsyncStreamServer 設定 (一個訂閱服務多個連線)
+        self.client_counter = None
+        self._register_metrics()
+        # MJPEG 送出節奏預設值 (fps 0 表示跟隨來源)
+        self.stream_max_fps = float(os.getenv("CS_STREAM_MAX_FPS", 0))
+        self.stream_max_age_ms = float(os.getenv("CS_STREAM_MAX_AGE_MS", 500))
+        # /snapshot 預設新鮮度與等待上限
+        self.snapshot_max_age_ms = float(os.getenv("CS_SNAPSHOT_MAX_AGE_MS", 1000))
+        self.snapshot_timeout_ms = float(os.getenv("CS_SNAPSHOT_TIMEOUT_MS", 2000))
         self._setup_routes()
 
     def _setup_routes(self):
         self.app.add_url_rule("/video", "video_feed", self.video_feed)
+        self.app.add_url_rule("/video/<cam_id>", "camera_feed", self.video_feed)
+        self.app.add_url_rule("/snapshot", "snapshot", self.snapshot)
+        self.app.add_url_rule("/snapshot/<cam_id>", "camera_snapshot", self.snapshot)
+        self.app.add_url_rule("/stats", "stats", self.stats)
+        self.app.add_url_rule("/metrics", "metrics", self.metrics)
 
-    def _start_ws_client(self):
-        def on_message(ws, message):
-            if isinstance(message, bytes):
-                try:
-                    packets = self.decoder.parse(message)
-                    for packet in packets:
-                        frames = self.decoder.decode(packet)
-                        for frame in frames:
-                            img = frame.to_ndarray(format='bgr24')
-                            if not self.frame_queue.full():
-                                self.frame_queue.put(img)
-                except av.AVError as e:
-                    logger.error(f"[Decode error] {e}")
-
-        def on_open(ws):
-            logger.info("[WebSocket Opened] Sending init commands")
-            initMessage = os.getenv("CS_WS_INIT_MESSAGE")
-            # DEV: "Basic YWRtaW46YTExMTExMQ=="
-            ws.send(initMessage)
-            ws.send("vobits=20,pbits=20,aobits=0,hq=1")
-
-        def on_error(ws, error):
-            logger.error(f"[WebSocket Error] {error}")
-
-        def on_close(ws, code, msg):
-            logger.warning(f"[WebSocket Closed] {code}: {msg}")
-
-        logger.info(f"[WebSocket Connecting] to {self.ws_url}")
-        while True:
-            try:
-                headerOrigin = os.getenv("CS_WS_ORIGIN")
-                ws = websocket.WebSocketApp(
-                    self.ws_url,
-                    header=[
-                        f"Origin: {headerOrigin}",
-                        "User-Agent: PythonClient/1.0",
-                    ],
-                    on_open=on_open,
-                    on_message=on_message,
-                    on_error=on_error,
-                    on_close=on_close,
-                )
-                ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
-            except Exception as e:
-                logger.error(f"[WebSocket Exception] {e}")
-            time.sleep(5)
-
-    def ensure_ws_running(self):
-        with self.ws_lock:
-            if not self.ws_started:
-                logger.info("Starting WebSocket thread")
-                self.ws_thread.start()
-                self.ws_started = True
-
-    def video_stream_generator(self):
-        self.ensure_ws_running()
-
-        while True:
-            try:
-                frame = self.frame_queue.get(timeout=1)
-            except queue.Empty:
-                logger.warning("No frame in queue, sending black frame")
-                frame = np.zeros((480, 640, 3), dtype=np.uint8)
-            yield frame
-            time.sleep(0.05)
-
-    def generate_frames(self):
-        for frame in self.video_stream_generator():
+    def _register_metrics(self):
+        # 於抓取時才計算的指標, 不影響熱路徑
+        REGISTRY.callback_gauge(
+            "cam_active_clients",
+            "MJPEG clients currently subscribed.",
+            ["camera"],
+            lambda: {
+                (cam_id,): self.client_count(camera)
+                for cam_id, camera in self.registry.cameras.items()
+            },
+        )
+        REGISTRY.callback_gauge(
+            "cam_encoder_queue_depth",
+            "Broadcasters waiting for a JPEG encoder worker.",
+            [],
+            lambda: {(): self.registry.encoder_pool.queue_depth},
+        )
+        REGISTRY.callback_gauge(
+            "cam_source_fps",
+            "Estimated incoming frame rate per camera.",
+            ["camera"],
+            lambda: {
+                (cam_id,): round(camera.decode_policy.source_fps, 2)
+                for cam_id, camera in self.registry.cameras.items()
+            },
+        )
+
+    def client_count(self, camera):
+        """
+        MJPEG clients of a camera: one broadcaster subscription per client,
+        except in asyncio mode where one pump subscription serves them all.
+        """
+        if self.client_counter is not None:
+            return self.client_counter(camera)
+        return camera.broadcaster.subscriber_count
+
+    def video_stream_generator(self, camera, pacer):
+        camera.ensure_running()
+        broadcaster = camera.broadcaster
+
+        # 每個連線有自己的讀取游標, 共用同一份已編碼的 JPEG
+        with broadcaster.subscribe() as subscriber:
             try:
-                _, buffer = cv2.imencode(".jpg", frame)
-                yield (
-                    b"--frame\r\n"
-                    b"Content-Type: image/jpeg\r\n"
-                    + f"Content-Length: {len(buffer)}\r\n\r\n".encode()
-                    + buffer.tobytes()
-                    + b"\r\n"
+                while True:
+                    encoded = subscriber.next_frame(timeout=1)
+                    if encoded is None:
+                        # 無新畫面時重送最後一張維持連線, 尚未收到畫面才送黑畫面
+                        logger.debug("No new frame from broadcaster, resending last")
+                        yield self.filler_jpeg(camera)
+                        continue
+
+                    delay = pacer.delay(encoded)
+                    if delay is None:
+                        continue  # 過期的 frame 直接丟棄
+                    if delay:
+                        time.sleep(delay)
+                    yield encoded.jpeg
+                    pacer.mark_sent(encoded)
+            finally:
+                pacer.close()
+                latency_ms = (pacer.latency or 0.0) * 1000
+                logger.info(
+                    f"[{camera.cam_id}] Video feed closed: sent {pacer.sent}, "
+                    f"dropped {pacer.dropped} stale, latency {latency_ms:.1f} ms"
                 )
-            except Exception as e:
-                logger.error(f"Frame encoding error: {e}")
 
-    def video_feed(self):
-        logger.info("Video feed requested")
+    def generate_frames(self, camera, pacer):
+        for jpeg in self.video_stream_generator(camera, pacer):
+            yield multipart_part(jpeg)
+
+    def filler_jpeg(self, camera):
+        latest = camera.broadcaster.latest()
+        if latest is None:
+            FILLER_FRAMES.labels(camera=camera.cam_id, kind="black").inc()
+            return self.black_jpeg
+        FILLER_FRAMES.labels(camera=camera.cam_id, kind="repeat").inc()
+        return latest.jpeg
+
+    def make_pacer(self, max_fps=None, max_age_ms=None, camera=None, client=None):
+        if max_fps is None:
+            max_fps = self.stream_max_fps
+        if max_age_ms is None:
+            max_age_ms = self.stream_max_age_ms
+        return FramePacer(
+            max_fps=max_fps,
+            max_age=max_age_ms / 1000,
+            camera=camera.cam_id if camera else "default",
+            client=client,
+        )
+
+    def _request_pacer(self, camera):
+        # 可由 query string 針對單一連線調整: /video?fps=5&max_age_ms=300
+        client = f"{request.remote_addr}:{request.environ.get('REMOTE_PORT', '')}"
+        return self.make_pacer(
+            request.args.get("fps", type=float),
+            request.args.get("max_age_ms", type=float),
+            camera,
+            client,
+        )
+
+    def video_feed(self, cam_id=None):
+        camera = self.registry.get(cam_id)
+        if camera is None:
+            abort(404, description=f"Unknown camera: {cam_id}")
+        logger.info(f"[{camera.cam_id}] Video feed requested")
         return Response(
-            self.generate_frames(),
-            mimetype="multipart/x-mixed-replace; boundary=frame"
+            self.generate_frames(camera, self._request_pacer(camera)),
+            mimetype="multipart/x-mixed-replace; boundary=frame",
+        )
+
+    def snapshot_result(self, camera, max_age_ms=None, if_none_match=None):
+        """
+        Look up the cached latest JPEG of a camera for /snapshot.
+
+        :param camera: CameraStream to read from.
+        :param max_age_ms: Freshness bound, defaults to CS_SNAPSHOT_MAX_AGE_MS.
+        :param if_none_match: Value of the If-None-Match request header.
+        :return: ``(status, jpeg_or_None, headers)``.
+        """
+        camera.ensure_running()
+        if max_age_ms is None:
+            max_age_ms = self.snapshot_max_age_ms
+        encoded = camera.broadcaster.snapshot(
+            max_age=max_age_ms / 1000, timeout=self.snapshot_timeout_ms / 1000
         )
+        if encoded is None:
+            return 503, None, {"Retry-After": "1"}
+
+        etag = f'"{camera.cam_id}-{camera.broadcaster.epoch}-{encoded.seq}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "no-cache",
+            "X-Frame-Timestamp": f"{encoded.timestamp:.3f}",
+        }
+        if if_none_match and (
+            if_none_match.strip() == "*"
+            or etag in [tag.strip() for tag in if_none_match.split(",")]
+        ):
+            return 304, None, headers
+        return 200, encoded.jpeg, headers
+
+    def snapshot(self, cam_id=None):
+        camera = self.registry.get(cam_id)
+        if camera is None:
+            abort(404, description=f"Unknown camera: {cam_id}")
+        status, jpeg, headers = self.snapshot_result(
+            camera,
+            request.args.get("max_age_ms", type=float),
+            request.headers.get("If-None-Match"),
+        )
+        if status == 503:
+            logger.warning(f"[{camera.cam_id}] No frame available for snapshot")
+        return Response(jpeg, status=status, headers=headers, mimetype="image/jpeg")
+
+    def stats(self):
+        return jsonify(self.registry.stats())
+
+    def metrics(self):
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
     def run(self):
+        self.registry.start_shm_cameras()
         logger.info(f"Starting Flask server on {self.host}:{self.port}")
         self.app.run(host=self.host, port=self.port, threaded=True)
 
+    def run_async(self):
+        """Serve from a single asyncio event loop instead of one thread per client."""
+        from async_server import AsyncStreamServer
+
+        self.registry.start_shm_cameras()
+        AsyncStreamServer(self).run()
+
 
 # 主程式執行
 if __name__ == "__main__":
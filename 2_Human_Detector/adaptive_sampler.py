@@ -0,0 +1,47 @@
+import time
+
+
+class AdaptiveSampler:
+    def __init__(self, idle_interval=2.0, active_interval=0.2, hold=5.0, decay=1.5):
+        """
+        Time-based sampling schedule driven by scene activity.
+
+        While idle, a frame is sampled every ``idle_interval`` seconds. Motion
+        or a detected person switches to ``active_interval`` immediately; the
+        fast rate is kept for ``hold`` seconds after the last activity, then
+        the interval grows by ``decay`` per sample back to ``idle_interval``.
+
+        :param idle_interval: Seconds between samples on an idle scene.
+        :param active_interval: Seconds between samples while active.
+        :param hold: Seconds the active rate is kept after activity.
+        :param decay: Interval growth factor per sample after ``hold``.
+        """
+        self.idle_interval = idle_interval
+        self.active_interval = min(active_interval, idle_interval)
+        self.hold = hold
+        self.decay = max(1.0, decay)
+        self.interval = idle_interval
+        self._next_sample = 0.0
+        self._active_until = 0.0
+
+    def due(self, now=None):
+        """:return: Whether the current frame should be sampled."""
+        now = time.monotonic() if now is None else now
+        if now < self._next_sample:
+            return False
+        if now >= self._active_until and self.interval < self.idle_interval:
+            self.interval = min(self.idle_interval, self.interval * self.decay)
+        self._next_sample = now + self.interval
+        return True
+
+    def on_activity(self, now=None):
+        """Motion or a person was seen: sample at the active rate."""
+        now = time.monotonic() if now is None else now
+        self._active_until = now + self.hold
+        if self.interval > self.active_interval:
+            self.interval = self.active_interval
+            self._next_sample = min(self._next_sample, now + self.active_interval)
+
+    @property
+    def active(self):
+        return self.interval < self.idle_interval
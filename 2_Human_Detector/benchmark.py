@@ -0,0 +1,329 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from person_detector import PersonDetector
+from event_codec import EVENT_FORMATS, FORMAT_JSON, encode_event
+from event_payload import PAYLOAD_MODES, image_payload
+from visit_tracker import box_iou
+
+# 離線重播錄影檔, 以最快速度跑完偵測流程
+# 量測各階段耗時, FPS 與準確率 (JSON 輸出)
+#   python benchmark.py ./test/sample/sample1.mp4 --detector v4 onnx \
+#       --ground-truth ./test/sample/ground_truth.json --output result.json
+#
+# ground truth 格式: frame 編號從 0 開始, [] 表示該畫面沒有人
+# (未列出的畫面不計入準確率)
+#   {"sample1.mp4": {"0": [[x, y, w, h], ...], "30": [], ...}}
+
+STAGES = ["decode", "preprocess", "forward", "postprocess", "callback"]
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def add(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+    def report(self, frames):
+        """:return: Per stage, totals, ms per inferred frame and call percentiles."""
+        report = {}
+        for stage, values in self.samples.items():
+            values = np.asarray(values or [0.0]) * 1000
+            report[stage] = {
+                "total_s": round(float(values.sum()) / 1000, 4),
+                "ms_per_frame": round(float(values.sum()) / max(1, frames), 3),
+                "calls": len(self.samples[stage]),
+                "p50_ms": round(float(np.percentile(values, 50)), 3),
+                "p95_ms": round(float(np.percentile(values, 95)), 3),
+                "max_ms": round(float(values.max()), 3),
+            }
+        return report
+
+
+class Accuracy:
+    def __init__(self, iou_threshold=0.5):
+        self.iou_threshold = iou_threshold
+        self.tp = self.fp = self.fn = self.frames = 0
+
+    def update(self, boxes, confidences, truth):
+        """Greedy match by confidence; each ground-truth box matches once."""
+        self.frames += 1
+        unmatched = [tuple(box) for box in truth]
+        for i in np.argsort(-np.asarray(confidences)):
+            if unmatched:
+                ious = box_iou(boxes[i], unmatched)
+                best = int(np.argmax(ious))
+                if ious[best] >= self.iou_threshold:
+                    unmatched.pop(best)
+                    self.tp += 1
+                    continue
+            self.fp += 1
+        self.fn += len(unmatched)
+
+    def report(self):
+        return {
+            "labeled_frames": self.frames,
+            "iou_threshold": self.iou_threshold,
+            "tp": self.tp,
+            "fp": self.fp,
+            "fn": self.fn,
+            "precision": (
+                round(self.tp / (self.tp + self.fp), 4) if self.tp + self.fp else None
+            ),
+            "recall": (
+                round(self.tp / (self.tp + self.fn), 4) if self.tp + self.fn else None
+            ),
+        }
+
+
+def create_detector(
+    name, threshold, batch_size, callback=None, model_path=None, threads=None
+):
+    """
+    :param name: ``v4`` (PersonDetector, OpenCV DNN), ``v8``
+        (PersonDetectorYOLO8, ultralytics) or ``onnx`` (PersonDetector,
+        ONNX Runtime).
+    """
+    options = dict(threshold=threshold, callback=callback, batch_size=batch_size)
+    if name == "v8":
+        from person_detector_v8 import PersonDetectorYOLO8
+
+        if model_path:
+            options["model_path"] = model_path
+        return PersonDetectorYOLO8(None, **options)
+    if name == "onnx":
+        from detector_backends import OnnxRuntimeBackend
+
+        backend_options = {"threads": threads}
+        if model_path:
+            backend_options["model_path"] = model_path
+        backend = OnnxRuntimeBackend(**backend_options)
+        return PersonDetector(None, backend=backend, **options)
+    if name == "v4":
+        return PersonDetector(None, **options)
+    raise ValueError(f"Unknown detector: {name}")
+
+
+def run_benchmark(
+    detector,
+    clip,
+    frame_interval=1,
+    truth=None,
+    iou_threshold=0.5,
+    encode=True,
+    payload="frame",
+    event_format=FORMAT_JSON,
+):
+    """
+    Replay a clip through the detector stages at maximum speed.
+
+    The stages are driven directly instead of through ``process_video``:
+    its capture thread drops frames whenever inference falls behind, which
+    would hide the real cost per frame and make runs incomparable.
+
+    :param truth: ``{frame index: [[x, y, w, h], ...]}``; labeled frames are
+        always inferred, whatever ``frame_interval`` is.
+    :param encode: Encode each reported frame like main.detection_callback,
+        without Redis.
+    :param payload: Event image payload (``frame``, ``crop`` or ``both``).
+    :param event_format: Event encoding (``json`` or ``binary``).
+    :return: Result dict of the run.
+    """
+    truth = {int(index): boxes for index, boxes in (truth or {}).items()}
+    timer = StageTimer()
+    accuracy = Accuracy(iou_threshold)
+    backend = detector.backend
+
+    # callback 階段單獨計時 (由 _handle_detections 內呼叫)
+    callback_time = [0.0]
+
+    def callback(label, confidence, frame, boxes=None, **kwargs):
+        start = time.perf_counter()
+        if encode:
+            json_value = {
+                "capture_datetime": datetime.now().isoformat(),
+                "predict_probability": f"{confidence:.2f}",
+                "class_label": label,
+            }
+            fields, images = image_payload(frame, boxes, payload)
+            json_value.update(fields)
+            encode_event(json_value, images, event_format)
+        callback_time[0] += time.perf_counter() - start
+
+    detector.callback = callback
+
+    cap = cv2.VideoCapture(clip)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video source: {clip}")
+
+    decoded = inferred = detections = 0
+    batch = []  # (frame index, job)
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal inferred, detections
+        if not batch:
+            return
+        start = time.perf_counter()
+        samples = [sample for _, job in batch for sample in job]
+        blob = backend.preprocess(samples)
+        timer.add("preprocess", time.perf_counter() - start)
+
+        # 與 backend.detect 相同, 依 batch_size 分段 forward
+        results = []
+        step = min(detector.batch_size, backend.max_batch or detector.batch_size)
+        for offset in range(0, len(samples), step):
+            chunk = samples[offset : offset + step]
+            start = time.perf_counter()
+            outputs = backend.infer(blob[offset : offset + step])
+            timer.add("forward", time.perf_counter() - start)
+            start = time.perf_counter()
+            results.extend(backend.postprocess(outputs, chunk, detector.threshold))
+            timer.add("postprocess", time.perf_counter() - start)
+
+        results = iter(results)
+        for index, job in batch:
+            parts = [next(results) for _ in job]
+            callback_time[0] = 0.0
+            start = time.perf_counter()
+            detected = detector._handle_detections(job, parts)
+            elapsed = time.perf_counter() - start
+            timer.add("callback", callback_time[0])
+            timer.samples["postprocess"][-1] += elapsed - callback_time[0]
+
+            detections += len(detected)
+            if index in truth:
+                accuracy.update(detected[:, :4], detected[:, 4], truth[index])
+        inferred += len(batch)
+        batch.clear()
+
+    try:
+        index = -1
+        while True:
+            start = time.perf_counter()
+            if not cap.grab():
+                break
+            index += 1
+            decoded += 1
+            if index % frame_interval != 0 and index not in truth:
+                timer.add("decode", time.perf_counter() - start)
+                continue
+            ret, frame = cap.retrieve()
+            timer.add("decode", time.perf_counter() - start)
+            if not ret or frame is None:
+                continue
+
+            start = time.perf_counter()
+            job = detector._sample(0, cap, frame)
+            timer.add("preprocess", time.perf_counter() - start)
+            batch.append((index, job))
+            if len(batch) >= detector.batch_size:
+                flush()
+        flush()
+    finally:
+        cap.release()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "clip": os.path.basename(clip),
+        "detector": type(detector).__name__,
+        "backend": type(backend).__name__,
+        "input_size": list(backend.input_size),
+        "threshold": detector.threshold,
+        "batch_size": detector.batch_size,
+        "frame_interval": frame_interval,
+        "payload": payload if encode else None,
+        "event_format": event_format if encode else None,
+        "frames_decoded": decoded,
+        "frames_inferred": inferred,
+        "detections": detections,
+        "elapsed_s": round(elapsed, 3),
+        "decode_fps": round(decoded / elapsed, 2) if elapsed else None,
+        "inference_fps": round(inferred / elapsed, 2) if elapsed else None,
+        "stages": timer.report(inferred),
+        "accuracy": accuracy.report() if truth else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Human Detector replay benchmark")
+    parser.add_argument("clips", nargs="+", help="recorded video files")
+    parser.add_argument(
+        "--detector", nargs="+", default=["v4"], choices=["v4", "v8", "onnx"]
+    )
+    parser.add_argument("--model-path", help="model of the v8 / onnx detector")
+    parser.add_argument("--threads", type=int, help="ONNX Runtime intra-op threads")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--frame-interval", type=int, default=1)
+    parser.add_argument("--ground-truth", help="labeled boxes (JSON), see header")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU of a match")
+    parser.add_argument("--no-encode", action="store_true", help="skip JPEG encoding")
+    parser.add_argument("--payload", default="frame", choices=PAYLOAD_MODES)
+    parser.add_argument("--event-format", default="json", choices=EVENT_FORMATS)
+    parser.add_argument("--output", help="result JSON path (default stdout)")
+    args = parser.parse_args()
+
+    ground_truth = {}
+    if args.ground_truth:
+        with open(args.ground_truth, "r", encoding="utf-8") as f:
+            ground_truth = json.load(f)
+
+    runs = []
+    for name in args.detector:
+        detector = create_detector(
+            name,
+            args.threshold,
+            args.batch_size,
+            model_path=args.model_path,
+            threads=args.threads,
+        )
+        for clip in args.clips:
+            result = run_benchmark(
+                detector,
+                clip,
+                frame_interval=max(1, args.frame_interval),
+                truth=ground_truth.get(os.path.basename(clip)),
+                iou_threshold=args.iou,
+                encode=not args.no_encode,
+                payload=args.payload,
+                event_format=args.event_format,
+            )
+            print(
+                f"[benchmark] {name} {result['clip']}: "
+                f"{result['inference_fps']} fps, accuracy {result['accuracy']}",
+                file=sys.stderr,
+            )
+            runs.append(result)
+
+    report = {
+        "created": datetime.now().isoformat(),
+        "host": {
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+        },
+        "runs": runs,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[benchmark] Result written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
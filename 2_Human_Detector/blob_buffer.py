@@ -0,0 +1,154 @@
+import cv2
+import numpy as np
+
+from frame_ring import letterbox_geometry
+
+BLOB_SCALE = 0.00392
+
+
+class BlobBuffer:
+    def __init__(self, input_size, letterbox=False, pad_value=0, scale=BLOB_SCALE):
+        """
+        Preallocated network input: frames are resized into a persistent
+        buffer, then channel-swapped, transposed and scaled in one pass
+        straight into a persistent NCHW float32 blob. Replaces
+        cv2.dnn.blobFromImage(s), which allocates a resized image and a new
+        blob for every frame.
+
+        The blob returned by ``fill`` is overwritten by the next call; run
+        inference on it before filling the buffer again.
+
+        :param input_size: Network input ``(width, height)``.
+        :param letterbox: Keep the aspect ratio and pad to ``input_size``
+            instead of stretching.
+        :param pad_value: Pixel value (0..255) of the letterbox padding.
+        :param scale: Pixel scale factor, 1/255 like the other network inputs.
+        """
+        self.input_size = tuple(input_size)
+        self.letterbox = letterbox
+        self.pad_value = np.float32(pad_value * scale)
+        self.scale = np.float32(scale)
+        input_width, input_height = self.input_size
+        self._blob = np.empty((0, 3, input_height, input_width), np.float32)
+        # 依縮放後尺寸保留 resize 目的緩衝區 (不同解析度的來源各一個)
+        self._resized = {}
+
+    def geometry(self, width, height):
+        """
+        :return: ``(input_w, input_h, scale_x, scale_y, pad_x, pad_y)`` of a
+            frame of ``width`` x ``height`` in this buffer.
+        """
+        input_width, input_height = self.input_size
+        if self.letterbox:
+            scale, pad_x, pad_y, _, _ = letterbox_geometry(
+                width, height, input_width, input_height
+            )
+            return input_width, input_height, scale, scale, pad_x, pad_y
+        return (
+            input_width,
+            input_height,
+            input_width / width,
+            input_height / height,
+            0,
+            0,
+        )
+
+    def fill(self, frames):
+        """
+        :param frames: BGR frames (HWC uint8), or ready NCHW blobs of one
+            image (e.g. substream or ROI inputs) which are copied as is.
+        :return: View of the persistent blob holding ``len(frames)`` inputs.
+        :raises ValueError: A ready blob is not at ``input_size``.
+        """
+        if len(self._blob) < len(frames):
+            self._blob = np.empty((len(frames),) + self._blob.shape[1:], np.float32)
+        blob = self._blob[: len(frames)]
+        for target, frame in zip(blob, frames):
+            if frame.ndim == 4:
+                # 已完成的輸入 (substream) 無法在此縮放, 否則人框座標換算會錯誤
+                if frame.shape[1:] != target.shape:
+                    height, width = frame.shape[2:]
+                    raise ValueError(
+                        f"Network input is {width}x{height} but the model expects "
+                        f"{self.input_size[0]}x{self.input_size[1]}; set the Cam "
+                        "Server substream size (CS_SUB_WIDTH/CS_SUB_HEIGHT) to the "
+                        "model input size"
+                    )
+                np.copyto(target, frame[0])
+            else:
+                self._fill_one(target, frame)
+        return blob
+
+    def _fill_one(self, target, frame):
+        input_width, input_height = self.input_size
+        height, width = frame.shape[:2]
+        pad_x = pad_y = 0
+        size = (input_width, input_height)
+        if self.letterbox:
+            _, pad_x, pad_y, *size = letterbox_geometry(
+                width, height, input_width, input_height
+            )
+        size = tuple(size)
+
+        if (width, height) == size:
+            resized = frame
+        else:
+            resized = self._resized.get(size)
+            if resized is None:
+                resized = np.empty((size[1], size[0], 3), np.uint8)
+                self._resized[size] = resized
+            cv2.resize(frame, size, dst=resized)
+
+        # BGR -> RGB, HWC -> CHW 與縮放一次完成, 直接寫入 blob
+        region = target[:, pad_y : pad_y + size[1], pad_x : pad_x + size[0]]
+        np.multiply(resized[:, :, ::-1].transpose(2, 0, 1), self.scale, out=region)
+        if pad_x or pad_y:
+            target[:, :pad_y] = self.pad_value
+            target[:, pad_y + size[1] :] = self.pad_value
+            target[:, :, :pad_x] = self.pad_value
+            target[:, :, pad_x + size[0] :] = self.pad_value
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import tracemalloc
+
+    # 與 cv2.dnn.blobFromImages 比較每張 frame 的耗時與記憶體配置
+    #   python blob_buffer.py [寬 高 batch 次數]
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 1920
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 1080
+    batch = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    iterations = int(sys.argv[4]) if len(sys.argv) > 4 else 200
+
+    rng = np.random.default_rng(0)
+    frames = [
+        rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(batch)
+    ]
+    buffer = BlobBuffer((416, 416))
+
+    def reference():
+        return cv2.dnn.blobFromImages(
+            frames, BLOB_SCALE, (416, 416), (0, 0, 0), True, crop=False
+        )
+
+    def preallocated():
+        return buffer.fill(frames)
+
+    assert np.allclose(reference(), preallocated(), atol=1e-6)
+    for name, run in (("blobFromImages", reference), ("BlobBuffer", preallocated)):
+        run()
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            run()
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:>14}: {elapsed / iterations / batch * 1000:.3f} ms per frame, "
+            f"{peak / 1024:.0f} KiB allocated per call "
+            f"({width}x{height}, batch {batch})"
+        )
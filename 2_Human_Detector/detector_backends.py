@@ -0,0 +1,264 @@
+import ast
+import os
+
+import cv2
+import numpy as np
+
+from blob_buffer import BlobBuffer
+from logger import setup_logger
+from yolo_postprocess import decode_yolo_outputs, decode_yolov8_outputs, scale_boxes
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+NAMES_PATH = os.path.join(BASE_PATH, "./yolo/coco.names")
+
+logger = setup_logger()
+
+
+def _check_files(*paths):
+    for path in paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Required file not found: {path}")
+
+
+def _load_names(path=NAMES_PATH):
+    with open(path, "r") as f:
+        return [line.strip() for line in f.readlines()]
+
+
+class DetectorBackend:
+    """
+    Inference backend of PersonDetector: preprocess -> infer -> postprocess.
+
+    Every backend takes the same network input, an NCHW float32 RGB blob
+    scaled to 0..1 at ``input_size`` (substream and ROI inputs already arrive
+    in this form), and returns person boxes in full-frame pixels, so the
+    video loop, ROIs, motion gate and tracking are shared by all of them.
+    """
+
+    input_size = (416, 416)
+    # 模型的 batch 維度固定時 (匯出時未開 dynamic), 限制每次推論張數
+    max_batch = None
+    # 等比縮放時補邊的像素值
+    pad_value = 0
+
+    def __init__(self, classes=None, letterbox=False):
+        """
+        :param classes: Class names of the model, coco.names by default.
+        :param letterbox: Keep the aspect ratio of full frames (padded to
+            ``input_size``) instead of stretching them.
+        """
+        self.classes = classes or _load_names()
+        self.person_class_id = self.classes.index("person")
+        self.letterbox = letterbox
+        self._buffer = None
+
+    @property
+    def buffer(self):
+        """Persistent input blob, created once ``input_size`` is known."""
+        if self._buffer is None or self._buffer.input_size != tuple(self.input_size):
+            self._buffer = BlobBuffer(self.input_size, self.letterbox, self.pad_value)
+        return self._buffer
+
+    def frame_geometry(self, width, height):
+        """:return: Geometry of a ``width`` x ``height`` frame in the input."""
+        return self.buffer.geometry(width, height)
+
+    def preprocess(self, samples):
+        """
+        :return: NCHW blob of the SampledFrame inputs, in a preallocated
+            buffer that the next call overwrites.
+        """
+        return self.buffer.fill(
+            [sample.frame if sample.blob is None else sample.blob for sample in samples]
+        )
+
+    def infer(self, blob):
+        """:return: Raw model outputs for the whole batch."""
+        raise NotImplementedError
+
+    def postprocess(self, outputs, samples, threshold):
+        """:return: Per sample, ``(boxes, confidences)`` in frame pixels."""
+        raise NotImplementedError
+
+    def detect(self, samples, threshold, batch_size=1):
+        """
+        Run the three stages for several SampledFrame inputs, at most
+        ``batch_size`` of them per inference call.
+        """
+        if self.max_batch:
+            batch_size = min(batch_size, self.max_batch)
+        results = []
+        for start in range(0, len(samples), batch_size):
+            chunk = samples[start : start + batch_size]
+            outputs = self.infer(self.preprocess(chunk))
+            results.extend(self.postprocess(outputs, chunk, threshold))
+        return results
+
+
+class OpenCVDnnBackend(DetectorBackend):
+    def __init__(
+        self,
+        weights_path=os.path.join(BASE_PATH, "./yolo/yolov4-tiny.weights"),
+        config_path=os.path.join(BASE_PATH, "./yolo/yolov4-tiny.cfg"),
+        names_path=NAMES_PATH,
+        letterbox=False,
+    ):
+        """
+        YOLO (Darknet) model on the OpenCV DNN module, YOLOv4-tiny by default.
+        """
+        # Check if all required files exist
+        _check_files(weights_path, config_path, names_path)
+        super().__init__(_load_names(names_path), letterbox)
+
+        # Load YOLO model
+        self.net = cv2.dnn.readNet(weights_path, config_path)
+        layer_names = self.net.getLayerNames()
+        self.output_layers = [
+            layer_names[i - 1] for i in self.net.getUnconnectedOutLayers()
+        ]
+
+    def infer(self, blob):
+        self.net.setInput(blob)
+        outs = self.net.forward(self.output_layers)
+
+        # 批次輸入時輸出為 (N, rows, 85), 單張時為 (rows, 85)
+        return [out.reshape(len(blob), -1, out.shape[-1]) for out in outs]
+
+    def postprocess(self, outputs, samples, threshold):
+        return [
+            decode_yolo_outputs(
+                [out[i] for out in outputs],
+                self.person_class_id,
+                threshold,
+                sample.geometry,
+            )
+            for i, sample in enumerate(samples)
+        ]
+
+
+class UltralyticsBackend(DetectorBackend):
+    pad_value = 114  # 與 ultralytics 的 letterbox 相同
+
+    def __init__(
+        self,
+        model_path=os.path.join(BASE_PATH, "./yolo/yolov8n.pt"),
+        letterbox=False,
+    ):
+        """
+        ultralytics YOLO model (PyTorch), YOLOv8n by default.
+
+        The blob is passed as a tensor, so ultralytics skips its own
+        letterbox and uses the shared preprocessing.
+        """
+        import torch
+        from ultralytics import YOLO
+
+        self._torch = torch
+        self.model = YOLO(model_path)
+        names = self.model.names
+        super().__init__([names[i] for i in sorted(names)], letterbox)
+
+    def infer(self, blob):
+        return self.model.predict(
+            self._torch.from_numpy(blob),
+            classes=[self.person_class_id],
+            conf=0.05,  # 實際門檻於 postprocess 套用
+            verbose=False,
+        )
+
+    def postprocess(self, outputs, samples, threshold):
+        results = []
+        for result, sample in zip(outputs, samples):
+            confidences = result.boxes.conf.cpu().numpy().astype(np.float32)
+            keep = confidences >= threshold
+            xywhn = result.boxes.xywhn.cpu().numpy()[keep]
+            results.append((scale_boxes(xywhn, sample.geometry), confidences[keep]))
+        return results
+
+
+class OnnxRuntimeBackend(DetectorBackend):
+    pad_value = 114
+
+    def __init__(
+        self,
+        model_path=os.path.join(BASE_PATH, "./yolo/yolov8n_int8.onnx"),
+        threads=None,
+        letterbox=False,
+    ):
+        """
+        YOLOv8 exported to ONNX (FP32 or INT8, see export_yolov8_onnx.py) on
+        the ONNX Runtime CPU execution provider.
+
+        :param model_path: Path to the .onnx model.
+        :param threads: Intra-op threads, None for the ONNX Runtime default.
+        """
+        import onnxruntime as ort
+
+        _check_files(model_path)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        batch, _, height, width = model_input.shape
+        if isinstance(batch, int):
+            self.max_batch = batch
+        if isinstance(width, int) and isinstance(height, int):
+            self.input_size = (width, height)
+        elif metadata.get("imgsz"):
+            # dynamic 匯出時 H/W 為符號維度, 改用 metadata 記錄的匯出尺寸 [h, w]
+            height, width = ast.literal_eval(metadata["imgsz"])
+            self.input_size = (width, height)
+        else:
+            logger.warning(
+                f"Model input size unknown, using default {self.input_size}: "
+                f"{model_path}"
+            )
+
+        # ultralytics 匯出時將類別名稱寫入 metadata
+        names = metadata.get("names")
+        if names:
+            names = ast.literal_eval(names)
+            super().__init__([names[i] for i in sorted(names)], letterbox)
+        else:
+            super().__init__(letterbox=letterbox)
+
+    def infer(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+    def postprocess(self, outputs, samples, threshold):
+        return [
+            decode_yolov8_outputs(
+                outputs[i],
+                self.person_class_id,
+                threshold,
+                self.input_size,
+                sample.geometry,
+            )
+            for i, sample in enumerate(samples)
+        ]
+
+
+BACKENDS = {
+    "opencv": OpenCVDnnBackend,
+    "ultralytics": UltralyticsBackend,
+    "onnx": OnnxRuntimeBackend,
+}
+
+
+def create_backend(name="opencv", **options):
+    """
+    :param name: ``opencv``, ``ultralytics`` or ``onnx``.
+    :param options: Keyword arguments of the backend class.
+    """
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown detector backend: {name}")
+    return backend_class(**options)
@@ -0,0 +1,154 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from logger import setup_logger
+
+RESTART_DELAY = 5.0  # 秒
+
+logger = setup_logger()
+
+
+def plan_cores(workers, cores=None):
+    """
+    Split the usable CPU cores between the camera workers.
+
+    With at least as many cores as workers, each worker gets its own
+    contiguous share (remaining cores go to the first workers); otherwise the
+    workers are spread round-robin over single cores.
+
+    :param workers: Number of camera workers.
+    :param cores: Usable core ids, the affinity of this process by default.
+    :return: One list of core ids per worker.
+    """
+    if cores is None:
+        cores = (
+            os.sched_getaffinity(0)
+            if hasattr(os, "sched_getaffinity")
+            else range(os.cpu_count() or 1)
+        )
+    cores = sorted(cores)
+    if workers >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(workers)]
+
+    plan = []
+    share, extra = divmod(len(cores), workers)
+    start = 0
+    for i in range(workers):
+        size = share + (1 if i < extra else 0)
+        plan.append(cores[start : start + size])
+        start += size
+    return plan
+
+
+def _run_worker(target, index, video_source, full_frame_source, cores, events):
+    # 綁定 CPU 核心, 並讓 OpenCV 執行緒數與分配到的核心數一致, 避免各攝影機互搶
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    cv2.setNumThreads(len(cores))
+    target(index, video_source, full_frame_source, len(cores), events)
+
+
+class DetectorSupervisor:
+    def __init__(self, target, cameras, publish, queue_size=64, cores=None):
+        """
+        Runs one detector process per camera, pinned to its own CPU cores,
+        and publishes the events of all of them through one Redis client.
+
+        Each worker is started as
+        ``target(index, video_source, full_frame_source, threads, events)``
+        after its affinity and ``cv2.setNumThreads(threads)`` were set, and
+        puts its encoded events into the shared ``events`` queue. A worker
+        that exits is restarted after RESTART_DELAY seconds.
+
+        :param target: Picklable worker function (module level).
+        :param cameras: List of ``(video_source, full_frame_source)``.
+        :param publish: ``publish(value)`` called in this process per event.
+        :param queue_size: Maximum number of events waiting to be published;
+            workers drop events while it is full.
+        :param cores: Usable core ids, the affinity of this process by default.
+        """
+        self.target = target
+        self.cameras = cameras
+        self.publish = publish
+        self.core_plan = plan_cores(len(cameras), cores)
+        # spawn: 不複製父行程的 OpenCV 執行緒池與 Redis 連線
+        self._context = multiprocessing.get_context("spawn")
+        self.events = self._context.Queue(maxsize=queue_size)
+        self._processes = [None] * len(cameras)
+        self._restart_at = [0.0] * len(cameras)
+        self._stop = threading.Event()
+
+    def run(self):
+        """Start the workers and supervise them until interrupted."""
+        publisher = threading.Thread(
+            target=self._publish_events, name="detector-publisher", daemon=True
+        )
+        publisher.start()
+        try:
+            while not self._stop.is_set():
+                for index in range(len(self.cameras)):
+                    self._ensure_worker(index)
+                self._stop.wait(1.0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            publisher.join(timeout=2.0)
+
+    def stop(self):
+        self._stop.set()
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout=5.0)
+
+    def _ensure_worker(self, index):
+        process = self._processes[index]
+        if process is not None and process.is_alive():
+            return
+        now = time.monotonic()
+        if process is not None:
+            logger.warning(
+                f"Camera {index}: detector process exited "
+                f"(exit code {process.exitcode}), restarting in {RESTART_DELAY:.0f}s"
+            )
+            self._processes[index] = None
+            self._restart_at[index] = now + RESTART_DELAY
+        if now < self._restart_at[index]:
+            return
+
+        video_source, full_frame_source = self.cameras[index]
+        process = self._context.Process(
+            target=_run_worker,
+            args=(
+                self.target,
+                index,
+                video_source,
+                full_frame_source,
+                self.core_plan[index],
+                self.events,
+            ),
+            name=f"detector-camera-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _publish_events(self):
+        while not self._stop.is_set():
+            try:
+                value = self.events.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            # 任何例外都不可結束此執行緒, 否則偵測行程仍在執行但事件不再送出
+            try:
+                self.publish(value)
+            except Exception as e:
+                logger.error(f"Publish failed, event dropped: {e}")
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import deque
+
+from logger import setup_logger
+from visit_tracker import VISIT_UPDATE
+
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+OVERFLOW_POLICIES = (DROP_OLDEST, COALESCE)
+
+logger = setup_logger()
+
+
+class CallbackDispatcher:
+    def __init__(self, callback, workers=2, max_queue=32, overflow=DROP_OLDEST):
+        """
+        Runs the detection callback (JPEG/base64 encoding, JSON, Redis) on a
+        small worker pool, so encoding and publishing never add latency to
+        the inference loop and a slow or unavailable Redis cannot stall it.
+
+        The instance is called like the callback itself. Events wait in a
+        bounded queue; when it is full the oldest detection or visit update
+        is dropped. With the ``coalesce`` policy an event also replaces a
+        queued detection of the same video source and label, or a queued
+        update of the same visit, so only the newest is sent. Visit start
+        and end events are never coalesced or dropped, and the events of one
+        visit are run one at a time in queue order, so downstream always
+        sees start before update before end.
+
+        :param callback: ``callback(label, confidence, frame, **kwargs)``.
+        :param workers: Number of worker threads.
+        :param max_queue: Maximum number of queued events.
+        :param overflow: ``drop_oldest`` or ``coalesce``.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.callback = callback
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.overflow = overflow
+        self._events = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._busy = 0
+        # 執行中的訪客: 同一訪客的事件依序由單一 worker 處理
+        self._active_visits = set()
+        self._counts = {"dispatched": 0, "dropped": 0, "coalesced": 0, "errors": 0}
+        self._workers = [
+            threading.Thread(
+                target=self._work, name=f"detector-callback-{i}", daemon=True
+            )
+            for i in range(self.workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def __call__(self, label, confidence, frame, **kwargs):
+        """Queue one event; never blocks on the callback."""
+        visit = kwargs.get("visit")
+        key = self._coalesce_key(label, visit, kwargs.get("source"))
+        visit_id = visit.visit_id if visit is not None else None
+        event = (key, visit_id, label, confidence, frame, kwargs)
+        with self._cond:
+            if self._closed:
+                return
+            if key is not None:
+                for i, (queued_key, *_) in enumerate(self._events):
+                    if queued_key == key:
+                        self._events[i] = event
+                        self._counts["coalesced"] += 1
+                        return
+            if len(self._events) >= self.max_queue:
+                # 佇列已滿: 丟棄最舊的可丟棄事件 (訪客 start / end 除外)
+                for i, queued in enumerate(self._events):
+                    if _droppable(queued):
+                        del self._events[i]
+                        self._counts["dropped"] += 1
+                        break
+                else:
+                    if _droppable(event):
+                        self._counts["dropped"] += 1
+                        return
+            self._events.append(event)
+            self._cond.notify_all()
+
+    def _coalesce_key(self, label, visit, source):
+        if self.overflow != COALESCE:
+            return None
+        # 不同攝影機的偵測事件不可互相取代
+        if visit is None:
+            return ("detection", source, label)
+        # start / end 事件不可合併, 否則下游會遺漏訪客的開始或結束
+        if visit.kind == VISIT_UPDATE:
+            return (VISIT_UPDATE, visit.visit_id)
+        return None
+
+    def _next_event(self):
+        # 最舊且其訪客沒有事件正在執行的事件 (同一訪客的後續事件等前一個完成)
+        for i, event in enumerate(self._events):
+            if event[1] is None or event[1] not in self._active_visits:
+                del self._events[i]
+                return event
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                event = self._next_event()
+                while event is None:
+                    if self._closed and not self._events:
+                        return
+                    self._cond.wait()
+                    event = self._next_event()
+                _, visit_id, label, confidence, frame, kwargs = event
+                if visit_id is not None:
+                    self._active_visits.add(visit_id)
+                self._busy += 1
+            try:
+                self.callback(label, confidence, frame, **kwargs)
+                error = False
+            except Exception as e:
+                logger.error(f"Detection callback failed: {e}")
+                error = True
+            with self._cond:
+                self._busy -= 1
+                self._counts["errors" if error else "dispatched"] += 1
+                if visit_id is not None:
+                    self._active_visits.discard(visit_id)
+                    self._cond.notify_all()
+
+    def stats(self):
+        """:return: Event counters and the current queue depth."""
+        with self._cond:
+            return dict(self._counts, queued=len(self._events), busy=self._busy)
+
+    def close(self, timeout=5.0):
+        """
+        Stop accepting events and let the workers finish the queued ones,
+        waiting at most ``timeout`` seconds.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(timeout=max(0.0, deadline - time.monotonic()))
+
+
+def _droppable(event):
+    """Detections and visit updates may be dropped, visit start / end may not."""
+    kwargs = event[-1]
+    visit = kwargs.get("visit")
+    return visit is None or visit.kind == VISIT_UPDATE
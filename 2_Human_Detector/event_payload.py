@@ -0,0 +1,105 @@
+import cv2
+import numpy as np
+
+from util import frame_to_jpeg
+
+PAYLOAD_FRAME = "frame"
+PAYLOAD_CROP = "crop"
+PAYLOAD_BOTH = "both"
+PAYLOAD_MODES = (PAYLOAD_FRAME, PAYLOAD_CROP, PAYLOAD_BOTH)
+
+
+def padded_crop(frame, boxes, padding=0.2):
+    """
+    Crop around all person boxes of a frame.
+
+    :param boxes: Boxes ``(x, y, w, h)`` in frame pixels.
+    :param padding: Margin added on each side, as a fraction of the width
+        and height of the boxes' union.
+    :return: ``(crop, (x, y, w, h))``, the crop a view into ``frame``.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    height, width = frame.shape[:2]
+    x0, y0 = boxes[:, :2].min(axis=0)
+    x1, y1 = (boxes[:, :2] + boxes[:, 2:]).max(axis=0)
+    pad_x, pad_y = (x1 - x0) * padding, (y1 - y0) * padding
+    x0, y0 = int(max(0, x0 - pad_x)), int(max(0, y0 - pad_y))
+    x1, y1 = int(min(width, x1 + pad_x)), int(min(height, y1 + pad_y))
+    x1, y1 = max(x1, x0 + 1), max(y1, y0 + 1)
+    return frame[y0:y1, x0:x1], (x0, y0, x1 - x0, y1 - y0)
+
+
+def relative_boxes(boxes, confidences, rect):
+    """
+    Boxes relative to the image they are shown on, so viewers can draw them
+    at any resolution the image is stored or displayed at.
+
+    :param boxes: Boxes ``(x, y, w, h)`` in frame pixels.
+    :param rect: ``(x, y, w, h)`` of the image in frame pixels.
+    :return: ``[[x, y, w, h, confidence], ...]``, coordinates in 0..1.
+    """
+    x0, y0, width, height = rect
+    return [
+        [
+            round(float(x - x0) / width, 4),
+            round(float(y - y0) / height, 4),
+            round(float(w) / width, 4),
+            round(float(h) / height, 4),
+            round(float(confidence), 2),
+        ]
+        for (x, y, w, h), confidence in zip(boxes, confidences)
+    ]
+
+
+def image_payload(frame, boxes, mode=PAYLOAD_FRAME, padding=0.2):
+    """
+    Image fields of a detection event. The frame is sent clean (encoded
+    once per event whatever the number of persons), with the boxes as data.
+
+    :param frame: Full-resolution frame.
+    :param boxes: ``[[x, y, w, h, confidence], ...]`` in frame pixels.
+    :param mode: ``frame`` (whole frame), ``crop`` (padded crop around the
+        persons) or ``both`` (frame as ``img``, crop as ``crop``).
+    :param padding: Crop margin, see padded_crop().
+    :return: ``(fields, images)``: ``frame_size``, ``boxes`` relative to the
+        ``img`` image and, for crops, ``crop_box``; JPEG bytes by name
+        (see event_codec.encode_event).
+    """
+    if mode not in PAYLOAD_MODES:
+        raise ValueError(f"Unknown payload mode: {mode}")
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 5)
+    height, width = frame.shape[:2]
+    fields = {"frame_size": [width, height]}
+    images = {}
+    frame_rect = (0, 0, width, height)
+    if mode != PAYLOAD_CROP or len(boxes) == 0:
+        images["img"] = frame_to_jpeg(frame)
+        fields["boxes"] = relative_boxes(boxes[:, :4], boxes[:, 4], frame_rect)
+    if mode != PAYLOAD_FRAME and len(boxes) > 0:
+        crop, rect = padded_crop(frame, boxes[:, :4], padding)
+        fields["crop_box"] = list(rect)
+        images["img" if mode == PAYLOAD_CROP else "crop"] = frame_to_jpeg(crop)
+        if mode == PAYLOAD_CROP:
+            fields["boxes"] = relative_boxes(boxes[:, :4], boxes[:, 4], rect)
+    return fields, images
+
+
+def draw_boxes(image, boxes, label="person"):
+    """
+    Draw ``[[x, y, w, h, confidence], ...]`` boxes in image pixels (in place).
+    Events carry clean images; annotations are drawn at view time only.
+    """
+    color = (0, 255, 0)  # Green for person
+    for x, y, w, h, confidence in boxes:
+        x, y, w, h = int(x), int(y), int(w), int(h)
+        cv2.rectangle(image, (x, y), (x + w, y + h), color, 2)
+        cv2.putText(
+            image,
+            f"{label} {confidence:.2f}",
+            (x, y - 10),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.5,
+            color,
+            2,
+        )
+    return image
@@ -0,0 +1,164 @@
+import argparse
+import os
+import re
+
+import cv2
+import numpy as np
+
+# YOLOv8 匯出為 ONNX (供 HD_BACKEND=onnx 使用), 可選擇以實際畫面校正量化為 INT8
+#   python export_yolov8_onnx.py --weights ./yolo/yolov8n.pt --imgsz 416 \
+#       --int8 --calibration ./test/sample/sample1.mp4
+# 需要 ultralytics, onnx, onnxruntime (僅匯出時需要 ultralytics)
+
+
+class FrameCalibrationReader:
+    def __init__(self, source, input_name, imgsz, samples=100):
+        """
+        Calibration data for static INT8 quantization, preprocessed exactly
+        like the detector input (RGB, 0..1, stretched to imgsz).
+
+        :param source: Video file/URL or directory of images.
+        :param input_name: Name of the model input.
+        :param imgsz: Network input size.
+        :param samples: Number of frames to use.
+        """
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._frames = iter(list(self._read_frames(source, samples)))
+
+    @staticmethod
+    def _read_frames(source, samples):
+        if os.path.isdir(source):
+            names = sorted(os.listdir(source))[:samples]
+            for name in names:
+                frame = cv2.imread(os.path.join(source, name))
+                if frame is not None:
+                    yield frame
+            return
+
+        # 均勻取樣整段影片
+        cap = cv2.VideoCapture(source)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or samples
+        step = max(1, total // samples)
+        index = 0
+        count = 0
+        while count < samples:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index % step == 0:
+                count += 1
+                yield frame
+            index += 1
+        cap.release()
+
+    def get_next(self):
+        frame = next(self._frames, None)
+        if frame is None:
+            return None
+        blob = cv2.dnn.blobFromImage(
+            frame, 0.00392, (self.imgsz, self.imgsz), (0, 0, 0), True, crop=False
+        )
+        return {self.input_name: blob.astype(np.float32)}
+
+
+def export_onnx(weights, imgsz, dynamic=True):
+    """:return: Path of the FP32 ONNX model written next to ``weights``."""
+    from ultralytics import YOLO
+
+    model_path = YOLO(weights).export(
+        format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=True
+    )
+    # dynamic 匯出的輸入 H/W 為符號維度, 偵測端由 metadata 的 imgsz 取得輸入尺寸
+    set_metadata(model_path, {"imgsz": str([imgsz, imgsz])}, overwrite=False)
+    return model_path
+
+
+def set_metadata(model_path, values, overwrite=True):
+    """
+    Write ``values`` into the ONNX model's metadata_props (read by
+    OnnxRuntimeBackend through the session's custom metadata map).
+
+    :param overwrite: Replace keys already present in the model.
+    """
+    import onnx
+
+    model = onnx.load(model_path)
+    props = {prop.key: prop for prop in model.metadata_props}
+    for key, value in values.items():
+        if key in props:
+            if overwrite:
+                props[key].value = value
+            continue
+        model.metadata_props.add(key=key, value=value)
+    onnx.save(model, model_path)
+
+
+def quantize_int8(model_path, output_path, calibration, imgsz, samples=100):
+    """
+    Static (QDQ) INT8 quantization with per-channel weights. The detection
+    head is kept in FP32, where INT8 costs the most accuracy for the least
+    speed.
+    """
+    import onnx
+    from onnxruntime.quantization import (
+        CalibrationMethod,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+
+    model = onnx.load(model_path)
+    input_name = model.graph.input[0].name
+
+    # ultralytics 節點名稱為 /model.<層>/..., 最後一層即偵測頭 (YOLOv8n: model.22)
+    names = [node.name for node in model.graph.node]
+    matches = [re.match(r"/model\.(\d+)/", name) for name in names]
+    layers = [int(match.group(1)) for match in matches if match]
+    head = f"/model.{max(layers)}/" if layers else None
+    nodes_to_exclude = [name for name in names if head and name.startswith(head)]
+
+    quantize_static(
+        model_path,
+        output_path,
+        FrameCalibrationReader(calibration, input_name, imgsz, samples),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=nodes_to_exclude,
+    )
+    # 類別名稱與匯出尺寸等 metadata 沿用 FP32 模型
+    set_metadata(
+        output_path,
+        {prop.key: prop.value for prop in model.metadata_props},
+        overwrite=False,
+    )
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export YOLOv8 to ONNX (FP32/INT8)")
+    parser.add_argument("--weights", default="./yolo/yolov8n.pt")
+    parser.add_argument("--imgsz", type=int, default=416)
+    parser.add_argument("--static-batch", action="store_true", help="batch fixed to 1")
+    parser.add_argument("--int8", action="store_true", help="also write an INT8 model")
+    parser.add_argument("--calibration", help="video or image directory for INT8")
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--output", help="INT8 model path (default *_int8.onnx)")
+    args = parser.parse_args()
+
+    model_path = export_onnx(args.weights, args.imgsz, dynamic=not args.static_batch)
+    print(f"FP32 model: {model_path}")
+
+    if args.int8:
+        if not args.calibration:
+            parser.error("--int8 requires --calibration")
+        output = args.output or model_path.replace(".onnx", "_int8.onnx")
+        quantize_int8(model_path, output, args.calibration, args.imgsz, args.samples)
+        print(f"INT8 model: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+# 共享記憶體環形緩衝區 (Cam Server 寫入, Human Detector 讀取)
+# 檔案格式:
+#   [header 64 bytes][slot 0][slot 1]...[slot N-1]
+#   header: magic, version, flags, slot_count, max_width, max_height, channels,
+#           latest_seq
+#   slot:   [slot header 32 bytes][pixels, max_width * max_height * channels]
+# 此檔案需與另一個服務目錄下的 frame_ring.py 保持一致
+
+MAGIC = b"WWHR"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIII")
+LATEST_SEQ = struct.Struct("<Q")
+LATEST_SEQ_OFFSET = HEADER.size
+HEADER_SIZE = 64
+SLOT_HEADER = struct.Struct("<QdII")
+SLOT_HEADER_SIZE = 32
+ALIGNMENT = 64
+
+# header flags: 畫面排列方式 (預設為 HWC BGR)
+FLAG_PLANAR = 0x1  # CHW (每個色彩一個平面)
+FLAG_RGB = 0x2  # RGB 順序
+FLAG_LETTERBOX = 0x4  # 等比縮放後補邊, 見 letterbox_geometry()
+
+
+def _align(value, alignment=ALIGNMENT):
+    return (value + alignment - 1) // alignment * alignment
+
+
+def _slot_stride(max_width, max_height, channels):
+    return _align(SLOT_HEADER_SIZE + max_width * max_height * channels)
+
+
+def letterbox_geometry(src_width, src_height, dst_width, dst_height):
+    """
+    Aspect-preserving fit of a source frame into a destination canvas.
+
+    :return: ``(scale, pad_x, pad_y, width, height)`` where the scaled image
+        of size width x height is placed at (pad_x, pad_y) in the canvas.
+    """
+    scale = min(dst_width / src_width, dst_height / src_height)
+    width = max(1, min(dst_width, round(src_width * scale)))
+    height = max(1, min(dst_height, round(src_height * scale)))
+    return scale, (dst_width - width) // 2, (dst_height - height) // 2, width, height
+
+
+def _frame_shape(flags, width, height, channels):
+    if flags & FLAG_PLANAR:
+        return (channels, height, width)
+    return (height, width, channels)
+
+
+class FrameRingWriter:
+    def __init__(
+        self,
+        path,
+        slot_count=4,
+        max_width=1920,
+        max_height=1080,
+        channels=3,
+        flags=0,
+    ):
+        """
+        Create (or reuse) a memory-mapped ring of the latest frames.
+
+        :param path: File backing the ring, normally under /dev/shm.
+        :param slot_count: Number of frames kept in the ring.
+        :param max_width: Largest frame width a slot can hold.
+        :param max_height: Largest frame height a slot can hold.
+        :param channels: Channels per pixel (3 for BGR).
+        :param flags: Layout flags (FLAG_PLANAR, FLAG_RGB, FLAG_LETTERBOX).
+        """
+        self.path = path
+        self.flags = flags
+        self.slot_count = slot_count
+        self.max_width = max_width
+        self.max_height = max_height
+        self.channels = channels
+        self.slot_stride = _slot_stride(max_width, max_height, channels)
+        size = HEADER_SIZE + self.slot_stride * slot_count
+
+        # 沿用既有檔案 (不 unlink), 讓已 mmap 的讀取端在寫入端重啟後仍有效
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+
+        self._mm[LATEST_SEQ_OFFSET : LATEST_SEQ_OFFSET + LATEST_SEQ.size] = (
+            LATEST_SEQ.pack(0)
+        )
+        HEADER.pack_into(
+            self._mm,
+            0,
+            MAGIC,
+            VERSION,
+            flags,
+            slot_count,
+            max_width,
+            max_height,
+            channels,
+        )
+        self.seq = 0
+
+    def write(self, frame, timestamp=None, seq=None):
+        """
+        Copy a frame into the next slot and publish it.
+
+        :param frame: Image as a NumPy array, (height, width, channels) or
+            (channels, height, width) for FLAG_PLANAR rings.
+        :param timestamp: Capture time in epoch seconds, defaults to now.
+        :param seq: Explicit sequence number (must increase), used to keep
+            several rings of the same camera aligned frame by frame.
+        :return: Sequence number assigned to the frame.
+        """
+        if self.flags & FLAG_PLANAR:
+            height, width = frame.shape[1:3]
+        else:
+            height, width = frame.shape[:2]
+        if width > self.max_width or height > self.max_height:
+            raise ValueError(
+                f"Frame {width}x{height} exceeds ring slot "
+                f"{self.max_width}x{self.max_height}"
+            )
+
+        seq = seq if seq is not None and seq > self.seq else self.seq + 1
+        offset = HEADER_SIZE + ((seq - 1) % self.slot_count) * self.slot_stride
+
+        # 先將 slot 標記為無效, 寫完像素後再填入序號 (讀取端以序號驗證)
+        SLOT_HEADER.pack_into(self._mm, offset, 0, 0.0, 0, 0)
+        data = np.ndarray(
+            _frame_shape(self.flags, width, height, self.channels),
+            dtype=np.uint8,
+            buffer=self._mm,
+            offset=offset + SLOT_HEADER_SIZE,
+        )
+        np.copyto(data, frame)
+        SLOT_HEADER.pack_into(
+            self._mm, offset, seq, timestamp or time.time(), width, height
+        )
+        LATEST_SEQ.pack_into(self._mm, LATEST_SEQ_OFFSET, seq)
+        self.seq = seq
+        return seq
+
+    def close(self):
+        self._mm.close()
+
+
+class FrameRingReader:
+    def __init__(self, path):
+        """
+        Attach read-only to a ring created by FrameRingWriter.
+
+        :param path: File backing the ring.
+        """
+        self.path = path
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            self._mm = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+
+        magic, version, flags, slot_count, max_width, max_height, channels = (
+            HEADER.unpack_from(self._mm, 0)
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a frame ring (v{VERSION}): {path}")
+        self.flags = flags
+        self.planar = bool(flags & FLAG_PLANAR)
+        self.rgb = bool(flags & FLAG_RGB)
+        self.letterbox = bool(flags & FLAG_LETTERBOX)
+        self.slot_count = slot_count
+        self.max_width = max_width
+        self.max_height = max_height
+        self.channels = channels
+        self.slot_stride = _slot_stride(max_width, max_height, channels)
+
+    @property
+    def latest_seq(self):
+        return LATEST_SEQ.unpack_from(self._mm, LATEST_SEQ_OFFSET)[0]
+
+    def _slot_offset(self, seq):
+        return HEADER_SIZE + ((seq - 1) % self.slot_count) * self.slot_stride
+
+    def is_valid(self, seq):
+        """Whether the slot for ``seq`` has not been overwritten yet."""
+        if seq <= 0:
+            return False
+        return SLOT_HEADER.unpack_from(self._mm, self._slot_offset(seq))[0] == seq
+
+    def get(self, seq):
+        """
+        Map the frame with sequence number ``seq`` without copying.
+
+        The returned array is a read-only view into the ring; it stays valid
+        until the writer wraps around, which ``is_valid(seq)`` can confirm.
+
+        :return: ``(timestamp, frame)``, or ``None`` if already overwritten.
+        """
+        if seq <= 0:
+            return None
+        offset = self._slot_offset(seq)
+        slot_seq, timestamp, width, height = SLOT_HEADER.unpack_from(self._mm, offset)
+        if slot_seq != seq:
+            return None
+        frame = np.ndarray(
+            _frame_shape(self.flags, width, height, self.channels),
+            dtype=np.uint8,
+            buffer=self._mm,
+            offset=offset + SLOT_HEADER_SIZE,
+        )
+        return timestamp, frame
+
+    def latest(self):
+        """:return: ``(seq, timestamp, frame)`` of the newest frame, or ``None``."""
+        seq = self.latest_seq
+        result = self.get(seq)
+        if result is None:
+            return None
+        return (seq,) + result
+
+    def wait_next(self, last_seq, timeout=1.0, poll_interval=0.005):
+        """
+        Wait for a frame newer than ``last_seq`` (latest-frame semantics).
+
+        :return: ``(seq, timestamp, frame)``, or ``None`` on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            seq = self.latest_seq
+            # 寫入端重啟後序號會歸零, 此時重新從最新一張開始
+            if seq != last_seq:
+                result = self.get(seq)
+                if result is not None:
+                    return (seq,) + result
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    def close(self):
+        self._mm.close()
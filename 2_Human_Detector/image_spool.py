@@ -0,0 +1,72 @@
+import glob
+import os
+import threading
+import time
+import uuid
+
+from logger import setup_logger
+
+logger = setup_logger()
+
+
+class ImageSpool:
+    def __init__(self, path, max_age=86400.0, sweep_interval=600.0):
+        """
+        Claim-check store for event images: each JPEG is written once into a
+        spool directory shared with the DB Writer, and only its file name
+        goes through Redis. The DB Writer moves the file into the image
+        folder, so Redis memory no longer depends on image size.
+
+        Put the spool inside the DB Writer's image folder (e.g.
+        ``<DBW_IMG_FOLDER>/.spool``) so that move is an atomic rename on the
+        same file system.
+
+        :param path: Spool directory.
+        :param max_age: Seconds after which unclaimed images are deleted
+            (events lost in Redis, e.g. when the queue TTL expired).
+        :param sweep_interval: Seconds between two sweeps of the spool.
+        """
+        self.path = path
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def put(self, images):
+        """
+        :param images: ``{name: JPEG bytes}``.
+        :return: ``{name: file name in the spool}``.
+        """
+        refs = {}
+        prefix = f"{time.time_ns()}_{uuid.uuid4().hex[:8]}"
+        for name, data in images.items():
+            filename = f"{prefix}_{name}.jpg"
+            # 先寫入暫存檔再改名, DB Writer 不會讀到寫到一半的檔案
+            temp_path = os.path.join(self.path, f".{filename}.tmp")
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, os.path.join(self.path, filename))
+            refs[name] = filename
+        self.sweep()
+        return refs
+
+    def sweep(self, now=None):
+        """Delete images nobody claimed within ``max_age`` seconds."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + self.sweep_interval
+        removed = 0
+        for path in glob.glob(os.path.join(self.path, "*.jpg")) + glob.glob(
+            os.path.join(self.path, ".*.tmp")
+        ):
+            try:
+                if now - os.path.getmtime(path) > self.max_age:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass  # 已被 DB Writer 取走
+        if removed:
+            logger.warning(f"Removed {removed} unclaimed spooled image(s): {self.path}")
@@ -1,32 +1,93 @@
-import json
 import os
+import queue
 from datetime import datetime
-from functools import partial
+from functools import lru_cache, partial
 
 from config_loader import (
     load_config,
 )
 from dotenv import load_dotenv
 from logger import setup_logger
+from detector_backends import create_backend
+from detector_supervisor import DetectorSupervisor
+from event_codec import FORMAT_JSON, encode_event
+from event_dispatcher import CallbackDispatcher
+from event_payload import PAYLOAD_FRAME, image_payload
+from image_spool import ImageSpool
 from person_detector import PersonDetector
 from redis_client import RedisClient
-from util import frame_to_base64
+from visit_tracker import VisitTracker
 
 # init global logger
 logger = setup_logger()
 
-def detection_callback(label, confidence, frame, redis_client, list_name, ttl=60):
-    logger.debug(f"Detected {label} with confidence {confidence:.2f}")
-    # Callback 收到判斷後往REDIS丟 整理檔案由後續服務來寫 避免此處同時處理檔案
-    
+
+def detection_event(label, confidence, frame, visit=None, boxes=None, source=None):
+    """:return: Encoded detection event, as written to the Redis queue."""
     json_value = {
         "capture_datetime": datetime.now().isoformat(),  # ISO 8601 format
-        "img_base64": frame_to_base64(frame),
         "predict_probability": f"{confidence:.2f}",
         "class_label": label,
     }
-    
-    redis_client.write_to_list(list_name, json.dumps(json_value), ttl)
+    if source is not None:
+        json_value["source"] = source  # 攝影機編號
+    if visit is not None:
+        boxes = [list(visit.box) + [visit.confidence]]
+    # 原始畫面 (每個事件只編碼一次) 及/或人形裁切圖, 人框以座標傳送, 由檢視端繪製;
+    # 訪客 end 事件沒有畫面, 只送資料 (不編碼 JPEG, 不佔 REDIS 頻寬與暫存目錄)
+    images = {}
+    if frame is not None:
+        fields, images = image_payload(
+            frame,
+            boxes if boxes is not None else [],
+            os.getenv("HD_PAYLOAD", PAYLOAD_FRAME).lower(),
+            float(os.getenv("HD_CROP_PADDING", 0.2)),
+        )
+        json_value.update(fields)
+    # 訪客追蹤: 每位訪客只送 start / update (更佳畫面) / end 事件
+    if visit is not None:
+        logger.info(f"Visit {visit.visit_id} {visit.kind} ({visit.duration:.1f}s)")
+        json_value.update(
+            {
+                "visit_id": visit.visit_id,
+                "visit_event": visit.kind,
+                "visit_started": datetime.fromtimestamp(visit.started_at).isoformat(),
+                "visit_duration": round(visit.duration, 1),
+                "source": visit.source,
+            }
+        )
+    # claim-check: 圖片寫入共用暫存目錄, REDIS 只傳檔名 (由 DB Writer 搬移)
+    spool = _image_spool()
+    if spool is not None and images:
+        json_value["image_refs"] = spool.put(images)
+        images = {}
+    # binary: header + JPEG 原始 bytes (省去 base64); json: 舊格式
+    event_format = os.getenv("HD_EVENT_FORMAT", FORMAT_JSON).lower()
+    return encode_event(json_value, images, event_format)
+
+
+def detection_callback(
+    label, confidence, frame, publish, visit=None, boxes=None, source=None
+):
+    logger.debug(f"Detected {label} with confidence {confidence:.2f}")
+    # Callback 收到判斷後往REDIS丟 整理檔案由後續服務來寫 避免此處同時處理檔案
+    publish(detection_event(label, confidence, frame, visit, boxes, source))
+
+
+def queue_callback(
+    label, confidence, frame, events, camera, visit=None, boxes=None, source=None
+):
+    logger.debug(f"Camera {camera}: detected {label} with confidence {confidence:.2f}")
+    # 多攝影機模式: 各偵測行程只負責編碼, 由主行程共用的 REDIS 連線寫入;
+    # 行程內只有一個來源 (source 為 0), 事件改記攝影機編號
+    if visit is not None:
+        visit = visit._replace(source=camera)
+    try:
+        events.put_nowait(
+            detection_event(label, confidence, frame, visit, boxes, camera)
+        )
+    except queue.Full:
+        logger.warning(f"Camera {camera}: publish queue full, event dropped")
 
 
 def main():
@@ -35,37 +96,211 @@ def main():
 
     # 讀取本地設定檔
     load_dotenv()
-    list_name = os.getenv("HD_REDIS_QUEUE")
-    ttl = int(os.getenv("HD_REDIS_QUEUE_TTL"))
-    frame_interval = int(os.getenv("HD_FRAME_INTERVAL"))
-    threshold = float(os.getenv("HD_THRESHOLD"))
 
     # 實體化REDIS
     redis_client = RedisClient()
+    publish = _publisher(redis_client)
     logger.info(f"Set Redis done") 
 
+    # 設定影片來源 (以逗號分隔可同時偵測多台攝影機)
+    video_path = _split_sources(os.getenv("HD_VIDEO_SOURCE"))
+    logger.info(f"Set Video Source: {video_path}")
+    # 使用 Cam Server 偵測用縮小畫面時, 需指定原始解析度的共享記憶體
+    full_frame_source = _split_sources(os.getenv("HD_FULL_FRAME_SOURCE"))
+
+    # 每台攝影機一個偵測行程 (各自綁定 CPU 核心), 共用一個 REDIS 連線
+    per_camera = os.getenv("HD_PROCESS_PER_CAMERA", "false").lower() == "true"
+    if per_camera and isinstance(video_path, list):
+        if not isinstance(full_frame_source, list):
+            full_frame_source = [full_frame_source] * len(video_path)
+        supervisor = DetectorSupervisor(
+            run_camera,
+            list(zip(video_path, full_frame_source)),
+            publish,
+            queue_size=int(os.getenv("HD_CALLBACK_QUEUE", 32)) * len(video_path),
+        )
+        for index, cores in enumerate(supervisor.core_plan):
+            logger.info(f"Camera {index}: process pinned to cores {cores}")
+        supervisor.run()
+        return
+
     # 綁定CALLBACK參數
-    callback_with_instance = partial(
-        detection_callback, redis_client=redis_client, list_name=list_name, ttl=ttl
+    callback_with_instance = partial(detection_callback, publish=publish)
+    dispatcher = _callback_dispatcher(callback_with_instance)
+    detector_tiny = create_detector(
+        video_path, full_frame_source, dispatcher, config.get("roi")
+    )
+
+    try:
+        detector_tiny.process_video(int(os.getenv("HD_FRAME_INTERVAL")))
+    finally:
+        dispatcher.close()
+        logger.info(f"Callback dispatcher: {dispatcher.stats()}")
+
+    # YOLOv8 (硬體需求較高): HD_BACKEND=ultralytics, 或於 Pi 上使用 INT8 ONNX 模型 HD_BACKEND=onnx
+
+
+def run_camera(index, video_source, full_frame_source, threads, events):
+    """Detector process of one camera, started by DetectorSupervisor."""
+    config = load_config()
+    load_dotenv()
+    logger.info(f"Camera {index}: {video_source}, {threads} thread(s)")
+
+    # ROI 設定依攝影機編號, 此行程內只有一個來源 (編號 0)
+    regions = {
+        int(source): specs for source, specs in (config.get("roi") or {}).items()
+    }
+    dispatcher = _callback_dispatcher(
+        partial(queue_callback, events=events, camera=index)
     )
+    detector = create_detector(
+        video_source,
+        full_frame_source,
+        dispatcher,
+        {0: regions[index]} if regions.get(index) else None,
+        threads=threads,
+    )
+    try:
+        detector.process_video(int(os.getenv("HD_FRAME_INTERVAL")))
+    finally:
+        dispatcher.close()
+        logger.info(f"Camera {index}: callback dispatcher: {dispatcher.stats()}")
+
+
+def create_detector(video_source, full_frame_source, callback, regions, threads=None):
+    """
+    PersonDetector configured from the environment.
 
-    # 設定影片來源
-    video_path = os.getenv("HD_VIDEO_SOURCE")
-    logger.info(f"Set Video Source: {video_path}") 
-    
-    # 實體化模型, 啟動辨識 (tiny)
-    detector_tiny = PersonDetector(
-        video_source=video_path, threshold=threshold, callback=callback_with_instance
+    :param threads: Inference threads when not set by HD_ONNX_THREADS.
+    """
+    threshold = float(os.getenv("HD_THRESHOLD"))
+    frame_interval = int(os.getenv("HD_FRAME_INTERVAL"))
+    batch_size = int(os.getenv("HD_BATCH_SIZE", 1))
+    batch_max_wait = float(os.getenv("HD_BATCH_MAX_WAIT_MS", 50)) / 1000
+    motion_gate = _motion_gate_options()
+    tracker = _visit_tracker()
+    sampling = _sampling_options()
+
+    # 實體化模型 (推論後端由 HD_BACKEND 選擇, 預設 tiny)
+    backend = _detector_backend(threads)
+    logger.info(f"Detector backend: {type(backend).__name__}")
+    detector = PersonDetector(
+        video_source=video_source,
+        threshold=threshold,
+        callback=callback,
+        full_frame_source=full_frame_source,
+        batch_size=batch_size,
+        batch_max_wait=batch_max_wait,
+        motion_gate=motion_gate,
+        regions=regions,
+        tracker=tracker,
+        sampling=sampling,
+        backend=backend,
     )
     logger.info(f"Ready to process video with threshold: {threshold}, frame_interval: {frame_interval}") 
+    logger.info(
+        f"Batch size: {batch_size}, batch max wait: {batch_max_wait * 1000:.0f} ms"
+    )
+    logger.info(f"Motion gate: {motion_gate}")
+    logger.info(f"Visit tracking: {'on' if tracker else 'off'}")
+    logger.info(f"Adaptive sampling: {sampling or 'off (HD_FRAME_INTERVAL)'}")
+    return detector
 
-    detector_tiny.process_video(frame_interval)
 
-    # 實體化模型, 啟動辨識 (v8 硬體需求較高)
-    # detector_v8 = PersonDetectorYOLO8(
-    #     video_source=video_path, threshold=threshold, callback=callback_with_instance
-    # )
-    # detector_v8.process_video(frame_interval)
+def _callback_dispatcher(callback):
+    # 編碼與寫入 REDIS 交給背景執行緒, 不佔用推論迴圈
+    dispatcher = CallbackDispatcher(
+        callback,
+        workers=int(os.getenv("HD_CALLBACK_WORKERS", 2)),
+        max_queue=int(os.getenv("HD_CALLBACK_QUEUE", 32)),
+        overflow=os.getenv("HD_CALLBACK_OVERFLOW", "drop_oldest").lower(),
+    )
+    logger.info(
+        f"Callback workers: {dispatcher.workers}, queue: {dispatcher.max_queue}, "
+        f"overflow: {dispatcher.overflow}"
+    )
+    return dispatcher
+
+
+def _detector_backend(threads=None):
+    name = os.getenv("HD_BACKEND", "opencv").lower()
+    options = {}
+    if os.getenv("HD_MODEL_PATH"):
+        options["model_path"] = os.getenv("HD_MODEL_PATH")
+    if name == "onnx" and (os.getenv("HD_ONNX_THREADS") or threads):
+        options["threads"] = int(os.getenv("HD_ONNX_THREADS") or threads)
+    if name == "opencv":
+        options.pop("model_path", None)
+    options["letterbox"] = os.getenv("HD_LETTERBOX", "false").lower() == "true"
+    return create_backend(name, **options)
+
+
+@lru_cache(maxsize=None)
+def _image_spool():
+    path = os.getenv("HD_IMAGE_SPOOL")
+    if not path:
+        return None
+    return ImageSpool(path, max_age=float(os.getenv("HD_IMAGE_SPOOL_MAX_AGE", 86400)))
+
+
+def _publisher(redis_client):
+    """:return: ``publish(value)`` writing events with the HD_REDIS_TRANSPORT."""
+    transport = os.getenv("HD_REDIS_TRANSPORT", "list").lower()
+    # stream: XADD + MAXLEN 裁切, DB Writer 以 consumer group 讀取 (可多個寫入者)
+    if transport == "stream":
+        stream_name = os.getenv("HD_REDIS_STREAM", "visitor_stream")
+        maxlen = int(os.getenv("HD_REDIS_STREAM_MAXLEN", 10000))
+        logger.info(f"Redis transport: stream {stream_name} (maxlen ~{maxlen})")
+        return partial(redis_client.write_to_stream, stream_name, maxlen=maxlen)
+    if transport != "list":
+        raise ValueError(f"Unknown Redis transport: {transport}")
+    # list: RPUSH, 整個 list 共用一個 TTL, 只能有一個 DB Writer
+    list_name = os.getenv("HD_REDIS_QUEUE")
+    logger.info(f"Redis transport: list {list_name}")
+    return partial(
+        redis_client.write_to_list, list_name, ttl=int(os.getenv("HD_REDIS_QUEUE_TTL"))
+    )
+
+
+def _split_sources(value):
+    if value and "," in value:
+        return [source.strip() for source in value.split(",")]
+    return value
+
+
+def _motion_gate_options():
+    method = os.getenv("HD_MOTION_GATE", "off").lower()
+    if method in ("", "off", "false"):
+        return None
+    return {
+        "method": method,
+        "sensitivity": float(os.getenv("HD_MOTION_SENSITIVITY", 25)),
+        "min_area": float(os.getenv("HD_MOTION_MIN_AREA", 0.002)),
+        "cooldown": float(os.getenv("HD_MOTION_COOLDOWN", 5)),
+    }
+
+
+def _visit_tracker():
+    if os.getenv("HD_VISIT_TRACKING", "false").lower() != "true":
+        return None
+    return VisitTracker(
+        iou_threshold=float(os.getenv("HD_VISIT_IOU", 0.3)),
+        end_timeout=float(os.getenv("HD_VISIT_END_TIMEOUT", 5)),
+        update_interval=float(os.getenv("HD_VISIT_UPDATE_INTERVAL", 30)),
+        min_hits=int(os.getenv("HD_VISIT_MIN_HITS", 1)),
+    )
+
+
+def _sampling_options():
+    idle_ms = os.getenv("HD_SAMPLE_IDLE_MS")
+    if not idle_ms:
+        return None
+    return {
+        "idle_interval": float(idle_ms) / 1000,
+        "active_interval": float(os.getenv("HD_SAMPLE_ACTIVE_MS", 200)) / 1000,
+        "hold": float(os.getenv("HD_SAMPLE_HOLD", 5)),
+        "decay": float(os.getenv("HD_SAMPLE_DECAY", 1.5)),
+    }
 
 
 if __name__ == "__main__":
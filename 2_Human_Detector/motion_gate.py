@@ -0,0 +1,108 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    def __init__(
+        self,
+        method="diff",
+        width=160,
+        sensitivity=25,
+        min_area=0.002,
+        cooldown=5.0,
+    ):
+        """
+        Cheap motion check in front of the detector network.
+
+        Frames are downscaled to ``width`` pixels, converted to grey and
+        compared with the previous sampled frame (``diff``) or fed to an
+        OpenCV MOG2 background subtractor (``mog2``). Inference is skipped
+        while the moving area stays below ``min_area``; after motion or a
+        detection the gate stays open for ``cooldown`` seconds so a person
+        standing still is not lost.
+
+        :param method: ``diff`` (frame differencing) or ``mog2``.
+        :param width: Width of the downscaled comparison frame.
+        :param sensitivity: Grey-level difference (diff) or MOG2 variance
+            threshold a pixel must exceed to count as moving.
+        :param min_area: Fraction of moving pixels that opens the gate.
+        :param cooldown: Seconds the gate stays open after motion.
+        """
+        if method not in ("diff", "mog2"):
+            raise ValueError(f"Unknown motion gate method: {method}")
+        self.method = method
+        self.width = width
+        self.sensitivity = sensitivity
+        self.min_area = min_area
+        self.cooldown = cooldown
+
+        self._subtractor = None
+        if method == "mog2":
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(
+                varThreshold=sensitivity, detectShadows=False
+            )
+        self._previous = None
+        self._open_until = 0.0
+
+        # 統計: 檢查次數, 略過推論次數, 最近一次的移動比例
+        self.checked = 0
+        self.skipped = 0
+        self.last_motion = 0.0
+
+    def _small_gray(self, frame, planar):
+        # 平面排列 (CHW) 時直接取中間的 G 平面作為灰階
+        image = frame[1] if planar else frame
+        height = max(1, round(image.shape[0] * self.width / image.shape[1]))
+        small = cv2.resize(image, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def motion_ratio(self, frame, planar=False):
+        """:return: Fraction of pixels considered moving in ``frame``."""
+        gray = self._small_gray(frame, planar)
+        if self._subtractor is not None:
+            mask = self._subtractor.apply(gray)
+            return np.count_nonzero(mask) / mask.size
+
+        previous, self._previous = self._previous, gray
+        # 第一張或解析度變更時無法比較, 視為有動態
+        if previous is None or previous.shape != gray.shape:
+            return 1.0
+        diff = cv2.absdiff(gray, previous)
+        return np.count_nonzero(diff > self.sensitivity) / diff.size
+
+    @property
+    def motion_detected(self):
+        """Whether the last checked frame had enough moving pixels."""
+        return self.checked > 0 and self.last_motion >= self.min_area
+
+    def should_infer(self, frame, planar=False, now=None):
+        """
+        :param frame: Sampled frame, HWC or CHW (``planar``).
+        :return: Whether the detector should run on this frame.
+        """
+        now = time.monotonic() if now is None else now
+        self.checked += 1
+        self.last_motion = self.motion_ratio(frame, planar)
+        if self.motion_detected:
+            self.hold(now)
+        if now < self._open_until:
+            return True
+        self.skipped += 1
+        return False
+
+    def hold(self, now=None):
+        """Keep the gate open for another ``cooldown`` seconds."""
+        now = time.monotonic() if now is None else now
+        self._open_until = max(self._open_until, now + self.cooldown)
+
+    def stats(self):
+        return {
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "inferred": self.checked - self.skipped,
+            "last_motion": round(float(self.last_motion), 4),
+        }
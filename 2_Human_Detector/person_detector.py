@@ -1,149 +1,437 @@
 import os
+import queue
+import threading
+import time
+from collections import namedtuple
 
 import cv2
 import numpy as np
 
+from adaptive_sampler import AdaptiveSampler
+from detector_backends import OpenCVDnnBackend
+from event_payload import draw_boxes
+from logger import setup_logger
+from motion_gate import MotionGate
+from roi import load_regions
+from video_source import (
+    ShmVideoCapture,
+    open_video_capture,
+    substream_blob,
+    substream_geometry,
+)
+from yolo_postprocess import merge_detections
+
+MOTION_REPORT_INTERVAL = 60.0  # 秒
+# 連續 grab 失敗達此次數時, 影片檔視為播放結束, 其他來源則重新開啟
+MAX_GRAB_FAILURES = 10
+GRAB_RETRY_DELAY = 0.1  # 秒
+REOPEN_DELAY = 5.0  # 秒
+
+logger = setup_logger()
+
+# 一次網路輸入: 來源編號, 已完成的網路輸入 (substream/ROI) 或 None,
+# 原始解析度畫面, 座標換算 (input_w, input_h, scale_x, scale_y, pad_x, pad_y),
+# 偵測區域 (Region 或 None). 同一張取樣畫面的多個 ROI 共用 frame
+SampledFrame = namedtuple(
+    "SampledFrame", ["source", "blob", "frame", "geometry", "region"]
+)
+
 
 class PersonDetector:
-    def __init__(self, video_source, threshold=0.5, callback=None):
+    def __init__(
+        self,
+        video_source,
+        threshold=0.5,
+        callback=None,
+        full_frame_source=None,
+        batch_size=1,
+        batch_max_wait=0.05,
+        motion_gate=None,
+        regions=None,
+        tracker=None,
+        sampling=None,
+        backend=None,
+    ):
         """
         Initialize the PersonDetector object.
 
-        :param video_source: Path to the video file or camera index.
+        :param video_source: Path to the video file or camera index, or a
+            list of them to detect on several cameras with one network.
         :param threshold: Confidence threshold for detecting persons.
-        :param callback: Function to call when a person is detected.
+        :param callback: Function to call when persons are detected, once per
+            frame as ``callback(label, confidence, frame, boxes=boxes,
+            source=source)`` with the clean frame, its best confidence,
+            ``boxes`` as an ``(n, 5)`` array of x, y, w, h, confidence in
+            frame pixels and the video source index; wrap it in a
+            CallbackDispatcher to run it off the inference loop.
+        :param full_frame_source: Full-resolution shm ring used for boxes and
+            snapshots when ``video_source`` is a Cam Server detector substream
+            (a list matching ``video_source`` for several cameras).
+        :param batch_size: Maximum number of sampled frames per forward pass.
+        :param batch_max_wait: Seconds to wait for a batch to fill up after
+            its first frame was sampled.
+        :param motion_gate: MotionGate options (dict) to skip inference on
+            still scenes, one gate per video source; None to always infer.
+        :param regions: Regions of interest per video source index,
+            ``{0: [[x, y, w, h], [[x, y], ...]], ...}`` in full-resolution
+            pixels; inference then runs on the cropped regions only.
+        :param tracker: VisitTracker; when set, the callback is called once
+            per visit event (with ``visit=VisitEvent``) instead of once per
+            box and frame.
+        :param sampling: AdaptiveSampler options (dict) to sample by time and
+            scene activity instead of every ``frame_interval`` frames.
+        :param backend: DetectorBackend doing the inference, YOLOv4-tiny on
+            OpenCV DNN (OpenCVDnnBackend) by default.
         """
         self.video_source = video_source
+        self.full_frame_source = full_frame_source
         self.threshold = threshold
         self.callback = callback
+        self.batch_size = max(1, batch_size)
+        self.batch_max_wait = batch_max_wait
+        self.motion_gate = motion_gate
+        self.motion_gates = []
+        self.regions = load_regions(regions)
+        self.tracker = tracker
+        self.sampling = sampling
+        self.samplers = []
 
-        # Get the absolute path of the current script
-        base_path = os.path.dirname(os.path.abspath(__file__))
-
-        # Use absolute paths for YOLO files
-        self.weights_path = os.path.join(base_path, "./yolo/yolov4-tiny.weights")
-        self.config_path = os.path.join(base_path, "./yolo/yolov4-tiny.cfg")
-        self.names_path = os.path.join(base_path, "./yolo/coco.names")
-
-        # Check if all required files exist
-        for path in [self.weights_path, self.config_path, self.names_path]:
-            if not os.path.exists(path):
-                raise FileNotFoundError(f"Required file not found: {path}")
-
-        # Load YOLOv4 model
-        self.net = cv2.dnn.readNet(self.weights_path, self.config_path)
-        layer_names = self.net.getLayerNames()
-        self.output_layers = [
-            layer_names[i - 1] for i in self.net.getUnconnectedOutLayers()
-        ]
-
-        # Load COCO class labels
-        with open(self.names_path, "r") as f:
-            self.classes = [line.strip() for line in f.readlines()]
+        # Inference backend (preprocess -> infer -> postprocess)
+        self.backend = backend or OpenCVDnnBackend()
+        self.classes = self.backend.classes
+        self.person_class_id = self.backend.person_class_id
 
     def process_video(self, frame_interval=30, debug_mode=False):
         """
         Process the video and detect persons in real-time based on frame count.
 
+        Each video source is read by its own capture thread, which only
+        grabs the skipped frames (no decode/copy) and retrieves every
+        ``frame_interval``-th one. Sampled frames go into a queue that keeps
+        only the newest ``batch_size`` of them, so inference always runs on
+        the freshest frames and capture never waits for inference.
+
+        The inference loop takes the first queued frame, then waits at most
+        ``batch_max_wait`` seconds to fill the batch up to ``batch_size`` and
+        runs a single forward pass for it.
+
         :param frame_interval: Number of frames to skip before processing the next frame.
         """
-        cap = cv2.VideoCapture(self.video_source)
+        # 推論跟不上時只保留最新的取樣, 避免延遲累積
+        pending = queue.Queue(maxsize=self.batch_size)
+        stop = threading.Event()
+        readers = []
+        sources = self._sources()
+        self.motion_gates = [
+            MotionGate(**self.motion_gate) if self.motion_gate is not None else None
+            for _ in sources
+        ]
+        self.samplers = [
+            AdaptiveSampler(**self.sampling) if self.sampling is not None else None
+            for _ in sources
+        ]
+        for index, (video_source, full_frame_source) in enumerate(sources):
+            cap = open_video_capture(video_source, full_frame_source)
 
-        # Check if video opened successfully
-        if not cap.isOpened():
-            raise ValueError(f"Cannot open video source: {self.video_source}")
+            # Check if video opened successfully
+            if not cap.isOpened():
+                raise ValueError(f"Cannot open video source: {video_source}")
+            readers.append(
+                threading.Thread(
+                    target=self._read_sampled,
+                    args=(index, cap, frame_interval, pending, stop),
+                    name=f"detector-capture-{index}",
+                    daemon=True,
+                )
+            )
+        for reader in readers:
+            reader.start()
 
-        frame_count = 0  # Initialize frame counter
+        try:
+            while any(reader.is_alive() for reader in readers) or not pending.empty():
+                batch = self._collect_batch(pending)
+                # 沒有推論時 (動態偵測關閉中) 也要結束逾時的訪客
+                if self.tracker:
+                    self._emit_visit_events(self.tracker.expire())
+                if not batch:
+                    continue
+                # 每張取樣畫面可能有多個 ROI 輸入, 推論後再依畫面分組
+                results = iter(
+                    self.detect_batch([sample for job in batch for sample in job])
+                )
+                for job in batch:
+                    boxes = self._handle_detections(job, [next(results) for _ in job])
+                    if debug_mode and not self._show(job[0], boxes):
+                        return
+        finally:
+            # Release resources
+            stop.set()
+            for reader in readers:
+                reader.join(timeout=2.0)
+            cv2.destroyAllWindows()
 
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret or frame is None or frame.shape[0] == 0 or frame.shape[1] == 0:
-                print("[警告] 無效的 frame 被略過")
+    def _read_sampled(self, source, cap, frame_interval, pending, stop):
+        frame_count = 0
+        gate = self.motion_gates[source]
+        sampler = self.samplers[source]
+        planar = getattr(cap, "substream", False) and cap.reader.planar
+        next_report = time.monotonic() + MOTION_REPORT_INTERVAL
+        failures = 0
+        try:
+            while cap is not None and cap.isOpened() and not stop.is_set():
+                # 略過的 frame 只 grab, 不做解碼後的色彩轉換與複製
+                if not cap.grab():
+                    failures += 1
+                    if failures < MAX_GRAB_FAILURES:
+                        stop.wait(GRAB_RETRY_DELAY)
+                    else:
+                        failures = 0
+                        cap = self._reopen(source, cap, stop)
+                    continue
+                failures = 0
+
+                # Increment frame counter
+                frame_count += 1
+
+                # Skip frames until the interval is reached
+                if sampler is not None:
+                    if not sampler.due():
+                        continue
+                elif frame_count % frame_interval != 0:
+                    continue
+
+                ret, frame = cap.retrieve()
+                if not ret or frame is None or frame.size == 0:
+                    logger.warning(f"Source {source}: invalid frame skipped")
+                    continue
+
+                # 畫面靜止時不送進模型
+                if gate is not None:
+                    if time.monotonic() >= next_report:
+                        logger.info(f"Motion gate, source {source}: {gate.stats()}")
+                        next_report = time.monotonic() + MOTION_REPORT_INTERVAL
+                    infer = gate.should_infer(frame, planar)
+                    if sampler is not None and gate.motion_detected:
+                        sampler.on_activity()
+                    if not infer:
+                        continue
+
+                job = self._sample(source, cap, frame)
+                if not job:
+                    continue
+                while True:
+                    try:
+                        pending.put_nowait(job)
+                        break
+                    except queue.Full:
+                        try:
+                            pending.get_nowait()
+                        except queue.Empty:
+                            pass
+        finally:
+            if cap is not None:
+                cap.release()
+
+    def _reopen(self, source, cap, stop):
+        """
+        Release a source that stopped delivering frames and open it again.
+
+        :return: The reopened capture, or ``None`` at the end of a video file
+            or when stopped.
+        """
+        video_source, full_frame_source = self._sources()[source]
+        cap.release()
+        if isinstance(video_source, str) and os.path.isfile(video_source):
+            logger.info(f"Source {source}: end of video file {video_source}")
+            return None
+        while not stop.is_set():
+            logger.warning(
+                f"Source {source}: no frame after {MAX_GRAB_FAILURES} attempts, "
+                f"reopening {video_source} in {REOPEN_DELAY:.0f}s"
+            )
+            if stop.wait(REOPEN_DELAY):
+                break
+            try:
+                cap = open_video_capture(video_source, full_frame_source)
+            except (OSError, ValueError) as e:
+                logger.error(f"Source {source}: cannot reopen {video_source}: {e}")
                 continue
-            if not ret:
+            if cap.isOpened():
+                return cap
+            cap.release()
+        return None
+
+    def _collect_batch(self, pending):
+        try:
+            batch = [pending.get(timeout=1.0)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_max_wait
+        while sum(len(job) for job in batch) < self.batch_size:
+            try:
+                remaining = max(0.0, deadline - time.monotonic())
+                batch.append(pending.get(timeout=remaining))
+            except queue.Empty:
                 break
+        return batch
 
-            # Increment frame counter
-            frame_count += 1
+    def _sources(self):
+        if isinstance(self.video_source, (list, tuple)):
+            video_sources = list(self.video_source)
+        else:
+            video_sources = [self.video_source]
+        if isinstance(self.full_frame_source, (list, tuple)):
+            full_frame_sources = list(self.full_frame_source)
+        else:
+            full_frame_sources = [self.full_frame_source] * len(video_sources)
+        return list(zip(video_sources, full_frame_sources))
 
-            # Skip frames until the interval is reached
-            if frame_count % frame_interval != 0:
-                continue
+    def _sample(self, source, cap, frame):
+        """
+        Prepare the network inputs of a sampled frame: the whole frame, or
+        one crop per region of interest of the source.
+
+        Shared-memory frames are copied here, once per sample, so inference
+        and the callbacks never depend on the ring not wrapping around.
+
+        :param source: Index of the video source the frame came from.
+        :return: List of SampledFrame sharing the same full-resolution frame,
+            or ``None`` if the full-resolution frame of a substream frame is
+            no longer available.
+        """
+        regions = self.regions.get(source)
+        ring, seq = None, 0
+        if getattr(cap, "substream", False):
+            # Substream frames are already RGB at network resolution
+            # (ROIs are cropped from the full-resolution frame instead)
+            blob = None if regions else substream_blob(frame, cap.reader.planar)
+
+            # Map network coordinates onto the full-resolution frame
+            frame = cap.full_frame()
+            if frame is None:
+                logger.warning(f"Source {source}: full-resolution frame not found")
+                return None
+            ring, seq = cap.full_reader, cap.full_seq
+            geometry = substream_geometry(cap, frame.shape[1], frame.shape[0])
+        else:
+            # 由推論執行緒寫入預先配置的 blob (拉伸或等比補邊)
+            blob = None
+            geometry = self.backend.frame_geometry(frame.shape[1], frame.shape[0])
+            if isinstance(cap, ShmVideoCapture):
+                ring, seq = cap.reader, cap.last_seq
+
+        # 共享記憶體 view 在取樣時就複製, 推論再久也不受 ring 覆寫影響;
+        # 複製途中被覆寫 (畫面可能不完整) 則略過此次取樣
+        if ring is not None:
+            frame = frame.copy()
+            if not ring.is_valid(seq):
+                logger.warning(f"Source {source}: frame overwritten while copying")
+                return None
 
-            # Prepare the frame for YOLO
+        if not regions:
+            return [SampledFrame(source, blob, frame, geometry, None)]
+
+        samples = []
+        input_size = self.backend.input_size
+        for region in regions:
+            crop = region.crop(frame)
+            if crop is None:
+                continue
+            image, offset_x, offset_y = crop
             blob = cv2.dnn.blobFromImage(
-                frame, 0.00392, (416, 416), (0, 0, 0), True, crop=False
+                image, 0.00392, input_size, (0, 0, 0), True, crop=False
             )
-            self.net.setInput(blob)
-            outs = self.net.forward(self.output_layers)
-
-            # Analyze detections
-            boxes = []
-            confidences = []
-            class_ids = []
-
-            for out in outs:
-                for detection in out:
-                    scores = detection[5:]
-                    class_id = np.argmax(scores)
-                    confidence = scores[class_id]
-                    if (
-                        confidence > self.threshold
-                        and self.classes[class_id] == "person"
-                    ):
-                        # Object detected
-                        center_x = int(detection[0] * frame.shape[1])
-                        center_y = int(detection[1] * frame.shape[0])
-                        w = int(detection[2] * frame.shape[1])
-                        h = int(detection[3] * frame.shape[0])
-
-                        # Rectangle coordinates
-                        x = int(center_x - w / 2)
-                        y = int(center_y - h / 2)
-
-                        boxes.append([x, y, w, h])
-                        confidences.append(float(confidence))
-                        class_ids.append(class_id)
-
-            # Apply Non-Maximum Suppression
-            indexes = cv2.dnn.NMSBoxes(boxes, confidences, 0.5, 0.4)
-
-            for i in range(len(boxes)):
-                if i in indexes:
-                    x, y, w, h = boxes[i]
-                    label = str(self.classes[class_ids[i]])
-                    confidence = confidences[i]
-                    color = (0, 255, 0)  # Green for person
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
-                    cv2.putText(
-                        frame,
-                        f"{label} {confidence:.2f}",
-                        (x, y - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.5,
-                        color,
-                        2,
-                    )
-
-                    # Call the callback function if provided
-                    if self.callback:
-                        self.callback(label, confidence, frame)
-
-            if debug_mode:
-                cv2.imshow("Video", frame)
-                if cv2.waitKey(1) & 0xFF == ord("q"):
-                    break
-
-        # Release resources
-        cap.release()
-        cv2.destroyAllWindows()
+            # frame_x = (input_x - pad_x) / scale_x = crop_x + offset_x
+            scale_x = input_size[0] / image.shape[1]
+            scale_y = input_size[1] / image.shape[0]
+            geometry = (
+                input_size[0],
+                input_size[1],
+                scale_x,
+                scale_y,
+                -offset_x * scale_x,
+                -offset_y * scale_y,
+            )
+            samples.append(SampledFrame(source, blob, frame, geometry, region))
+        return samples
+
+    def detect_batch(self, samples):
+        """
+        Run inference for several network inputs, at most ``batch_size``
+        of them per forward pass.
+
+        :param samples: List of SampledFrame.
+        :return: Per sample, ``(boxes, confidences)`` in frame pixels.
+        """
+        return self.backend.detect(samples, self.threshold, self.batch_size)
+
+    def _handle_detections(self, job, detections):
+        """
+        Filter and report the persons found in one sampled frame.
+
+        :param job: SampledFrame inputs of the frame (one per ROI).
+        :param detections: ``(boxes, confidences)`` of each input.
+        :return: Array ``(n, 5)`` of x, y, w, h, confidence in frame pixels.
+        """
+        sample = job[0]
+        frame = sample.frame
+        boxes_list, confidences_list = [], []
+        for part, (boxes, confidences) in zip(job, detections):
+            if part.region is not None and len(boxes) > 0:
+                inside = part.region.contains(boxes)
+                boxes, confidences = boxes[inside], confidences[inside]
+            boxes_list.append(boxes)
+            confidences_list.append(confidences)
+        boxes, confidences = merge_detections(boxes_list, confidences_list)
+
+        # 偵測到人時延長動態偵測的開啟時間, 避免靜止的訪客被略過
+        gate = self.motion_gates[sample.source] if self.motion_gates else None
+        if len(boxes) > 0 and gate is not None:
+            gate.hold()
+        sampler = self.samplers[sample.source] if self.samplers else None
+        if len(boxes) > 0 and sampler is not None:
+            sampler.on_activity()
+
+        # 事件帶原始畫面與人框座標, 不在畫面上繪製 (由檢視端繪製)
+        detected = np.column_stack([boxes, confidences]).astype(np.float32)
+        if self.callback and not self.tracker and len(boxes) > 0:
+            label = self.classes[self.person_class_id]
+            self.callback(
+                label,
+                float(confidences.max()),
+                frame,
+                boxes=detected,
+                source=sample.source,
+            )
+
+        if self.tracker:
+            self._emit_visit_events(
+                self.tracker.update(sample.source, boxes, confidences, frame)
+            )
+        return detected
+
+    def _emit_visit_events(self, events):
+        if not self.callback:
+            return
+        label = self.classes[self.person_class_id]
+        for event in events:
+            self.callback(
+                label, event.confidence, event.frame, visit=event, source=event.source
+            )
+
+    def _show(self, sample, boxes):
+        label = self.classes[self.person_class_id]
+        frame = draw_boxes(sample.frame.copy(), boxes, label)
+        source = sample.source
+        cv2.imshow("Video" if source == 0 else f"Video {source}", frame)
+        return not (cv2.waitKey(1) & 0xFF == ord("q"))
 
 
 # Test mode
 if __name__ == "__main__":
 
-    def detection_callback(label, confidence, frame):
-        print(f"Detected {label} with confidence {confidence:.2f} at {frame}")
+    def detection_callback(label, confidence, frame, boxes=None, visit=None):
+        print(f"Detected {label} with confidence {confidence:.2f} at {boxes}")
 
     video_path = os.path.join(
         os.path.dirname(os.path.abspath(__file__)), "./test/sample/sample1.mp4"
@@ -27,7 +27,8 @@ class RedisClient:
         Write a value to a Redis list and optionally set its expiration time.
 
         :param list_name: The name of the Redis list.
-        :param value: The value to append to the list.
+        :param value: The value to append to the list (str, or bytes for
+            binary events, see event_codec).
         :param ttl: Time-to-live for the list in seconds (optional).
         """
         try:
@@ -37,6 +38,25 @@ class RedisClient:
         except redis.RedisError as e:
             raise RuntimeError(f"Error writing to list '{list_name}': {e}")
 
+    def write_to_stream(self, stream_name, value, maxlen=None):
+        """
+        Append a value to a Redis stream, read by the DB Writers through a
+        consumer group (XREADGROUP / XACK), so several writers can share the
+        events and none is lost if a writer stops before storing it.
+
+        :param stream_name: The name of the Redis stream.
+        :param value: The value to append, stored in the ``event`` field.
+        :param maxlen: Approximate maximum number of entries kept in the
+            stream (optional); older entries are trimmed instead of expiring
+            the whole key like the list TTL.
+        """
+        try:
+            self.client.xadd(
+                stream_name, {"event": value}, maxlen=maxlen or None, approximate=True
+            )
+        except redis.RedisError as e:
+            raise RuntimeError(f"Error writing to stream '{stream_name}': {e}")
+
 
 if __name__ == "__main__":
     import json
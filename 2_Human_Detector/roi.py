@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+
+
+class Region:
+    def __init__(self, spec):
+        """
+        Region of interest in full-resolution frame pixels.
+
+        Detection runs on the bounding rectangle of the region only. For a
+        polygon, boxes whose center falls outside the polygon are dropped.
+
+        :param spec: Rectangle ``[x, y, w, h]`` or polygon ``[[x, y], ...]``.
+        """
+        points = np.asarray(spec, dtype=np.int32)
+        if points.ndim == 1:
+            if points.size != 4:
+                raise ValueError(f"ROI rectangle must be [x, y, w, h]: {spec}")
+            self.rect = tuple(int(value) for value in points)
+            self.polygon = None
+        else:
+            if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+                raise ValueError(f"ROI polygon needs at least 3 [x, y] points: {spec}")
+            self.rect = cv2.boundingRect(points)
+            self.polygon = points
+
+    def crop(self, frame):
+        """
+        :return: ``(view, offset_x, offset_y)`` of the region clipped to the
+            frame, or ``None`` if the region lies outside the frame.
+        """
+        x, y, w, h = self.rect
+        height, width = frame.shape[:2]
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(width, x + w), min(height, y + h)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return frame[y0:y1, x0:x1], x0, y0
+
+    def contains(self, boxes):
+        """:return: Mask of boxes (x, y, w, h) whose center lies in the region."""
+        if self.polygon is None:
+            return np.ones(len(boxes), dtype=bool)
+        centers = boxes[:, :2] + boxes[:, 2:] / 2
+        return np.array(
+            [
+                cv2.pointPolygonTest(self.polygon, (float(x), float(y)), False) >= 0
+                for x, y in centers
+            ],
+            dtype=bool,
+        )
+
+
+def load_regions(regions):
+    """
+    :param regions: ``{source index: [spec, ...]}`` as in the ``roi`` config
+        section, or None.
+    :return: ``{source index: [Region, ...]}``.
+    """
+    return {
+        int(source): [Region(spec) for spec in specs]
+        for source, specs in (regions or {}).items()
+        if specs
+    }
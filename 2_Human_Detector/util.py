@@ -8,6 +8,18 @@ import cv2
 import numpy as np
 
 
+# frame轉為JPEG
+def frame_to_jpeg(frame):
+    """
+    Encode a frame (image) as JPEG.
+
+    :param frame: The image frame from OpenCV.
+    :return: JPEG bytes of the image.
+    """
+    _, buffer = cv2.imencode(".jpg", frame)
+    return buffer.tobytes()
+
+
 # frame轉為base64
 def frame_to_base64(frame):
     """
@@ -16,10 +28,8 @@ def frame_to_base64(frame):
     :param frame: The image frame from OpenCV.
     :return: Base64-encoded string of the image.
     """
-    # Encode the frame as a JPEG image
-    _, buffer = cv2.imencode(".jpg", frame)
-    # Convert the buffer to a Base64 string
-    base64_image = base64.b64encode(buffer).decode("utf-8")
+    # Encode the frame as a JPEG image, then convert it to a Base64 string
+    base64_image = base64.b64encode(frame_to_jpeg(frame)).decode("utf-8")
     return base64_image
 
 
@@ -0,0 +1,132 @@
+import cv2
+import numpy as np
+
+from frame_ring import FrameRingReader, letterbox_geometry
+
+SHM_SCHEME = "shm://"
+
+
+class ShmVideoCapture:
+    def __init__(self, path, timeout=1.0, full_path=None):
+        """
+        cv2.VideoCapture-like reader over the Cam Server shared-memory ring.
+
+        Frames are returned as read-only NumPy views into shared memory, so
+        no decode or copy happens on the detector side. Copy a frame before
+        drawing on it or keeping it beyond the ring's lifetime.
+
+        :param path: Path of the ring file, e.g. /dev/shm/wwh_frames.
+        :param timeout: Seconds to wait for a new frame in read().
+        :param full_path: Full-resolution ring of the same camera when
+            ``path`` is a detector substream; see full_frame().
+        """
+        self.path = path
+        self.timeout = timeout
+        self.reader = FrameRingReader(path)
+        self.full_reader = FrameRingReader(full_path) if full_path else None
+        # 偵測用縮小畫面 (RGB, 可能為等比補邊/平面排列)
+        self.substream = self.reader.rgb
+        self.last_seq = self.reader.latest_seq
+        self.last_timestamp = None
+        # 最後一次 full_frame() 回傳的原始解析度 frame 序號
+        self.full_seq = 0
+        self._opened = True
+
+    def isOpened(self):
+        return self._opened
+
+    def grab(self):
+        """Advance to the next frame without touching its pixels."""
+        result = self.reader.wait_next(self.last_seq, timeout=self.timeout)
+        if result is None:
+            return False
+        self.last_seq = result[0]
+        return True
+
+    def retrieve(self):
+        """:return: ``(ret, frame)`` of the frame selected by the last grab()."""
+        result = self.reader.get(self.last_seq)
+        if result is None:
+            return False, None
+        self.last_timestamp, frame = result
+        return True, frame
+
+    def read(self):
+        """:return: ``(ret, frame)`` like cv2.VideoCapture.read()."""
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def full_frame(self):
+        """
+        Full-resolution BGR view of the frame last returned by read(), or the
+        newest one if it has already been overwritten.
+        """
+        if self.full_reader is None:
+            return None
+        seq = self.last_seq
+        result = self.full_reader.get(seq)
+        if result is None:
+            result = self.full_reader.latest()
+            if result is None:
+                return None
+            seq, result = result[0], result[1:]
+        self.full_seq = seq
+        return result[1]
+
+    def release(self):
+        if self._opened:
+            self.reader.close()
+            if self.full_reader:
+                self.full_reader.close()
+            self._opened = False
+
+
+def substream_blob(frame, planar, scale=0.00392):
+    """
+    Build the network input from a substream frame that is already RGB and
+    at detector resolution, so no resize or channel swap is needed.
+    """
+    if planar:
+        return frame[np.newaxis].astype(np.float32) * np.float32(scale)
+    return cv2.dnn.blobFromImage(frame, scale, None, (0, 0, 0), False, crop=False)
+
+
+def substream_geometry(cap, frame_width, frame_height):
+    """
+    Mapping from substream pixels back to full-frame pixels:
+    ``frame_x = (sub_x - pad_x) / scale_x``.
+
+    :return: ``(input_width, input_height, scale_x, scale_y, pad_x, pad_y)``.
+    """
+    reader = cap.reader
+    input_width, input_height = reader.max_width, reader.max_height
+    if reader.letterbox:
+        scale, pad_x, pad_y, _, _ = letterbox_geometry(
+            frame_width, frame_height, input_width, input_height
+        )
+        return input_width, input_height, scale, scale, pad_x, pad_y
+    return (
+        input_width,
+        input_height,
+        input_width / frame_width,
+        input_height / frame_height,
+        0,
+        0,
+    )
+
+
+def open_video_capture(video_source, full_frame_source=None):
+    """
+    Open a video source: ``shm://<path>`` for the shared-memory ring,
+    anything else (file, URL, camera index) through cv2.VideoCapture.
+
+    :param full_frame_source: ``shm://<path>`` of the full-resolution ring
+        when ``video_source`` is a detector substream.
+    """
+    if isinstance(video_source, str) and video_source.startswith(SHM_SCHEME):
+        full_path = None
+        if full_frame_source and full_frame_source.startswith(SHM_SCHEME):
+            full_path = full_frame_source[len(SHM_SCHEME) :]
+        return ShmVideoCapture(video_source[len(SHM_SCHEME) :], full_path=full_path)
+    return cv2.VideoCapture(video_source)
@@ -0,0 +1,187 @@
+import time
+import uuid
+from collections import namedtuple
+
+import numpy as np
+
+VISIT_START = "start"
+VISIT_UPDATE = "update"
+VISIT_END = "end"
+
+# 訪客事件: 種類, 訪客編號, 來源編號, 最佳信心值與其畫面/人框, 開始時間 (epoch), 持續秒數
+# end 事件只帶停留時間等資料, frame 為 None (最佳畫面已於 start/update 送出)
+VisitEvent = namedtuple(
+    "VisitEvent",
+    [
+        "kind",
+        "visit_id",
+        "source",
+        "confidence",
+        "frame",
+        "box",
+        "started_at",
+        "duration",
+    ],
+)
+
+
+def box_iou(box, boxes):
+    """:return: IoU of one (x, y, w, h) box against an array of boxes."""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[0] + box[2], boxes[:, 0] + boxes[:, 2])
+    y2 = np.minimum(box[1] + box[3], boxes[:, 1] + boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    union = box[2] * box[3] + boxes[:, 2] * boxes[:, 3] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class Visit:
+    def __init__(self, source, box, confidence, frame, now):
+        self.visit_id = uuid.uuid4().hex[:12]
+        self.source = source
+        self.box = box
+        self.first_seen = now
+        self.last_seen = now
+        self.started_at = time.time()
+        self.hits = 1
+        self.started = False
+
+        # 目前為止信心值最高的畫面, 於 start/update 事件送出
+        self.best_confidence = confidence
+        self.best_frame = frame
+        self.best_box = box
+        self.best_pending = False
+        self.last_event = now
+
+    def observe(self, box, confidence, frame, now):
+        self.box = box
+        self.last_seen = now
+        self.hits += 1
+        if confidence > self.best_confidence:
+            self.best_confidence = confidence
+            self.best_frame = frame
+            self.best_box = box
+            self.best_pending = True
+
+    def event(self, kind, now):
+        self.last_event = now
+        self.best_pending = False
+        return VisitEvent(
+            kind,
+            self.visit_id,
+            self.source,
+            self.best_confidence,
+            None if kind == VISIT_END else self.best_frame,
+            self.best_box,
+            self.started_at,
+            self.last_seen - self.first_seen,
+        )
+
+
+class VisitTracker:
+    """
+    Groups per-frame person boxes into visits with a greedy IoU / centroid
+    matcher, so downstream receives one start event, occasional best-frame
+    updates and one end event per visitor instead of one event per box.
+    """
+
+    def __init__(
+        self,
+        iou_threshold=0.3,
+        max_distance=0.15,
+        end_timeout=5.0,
+        update_interval=30.0,
+        min_hits=1,
+    ):
+        """
+        :param iou_threshold: Minimum IoU to continue a visit with a box.
+        :param max_distance: Fallback centroid distance, as a fraction of the
+            frame diagonal, for boxes that moved too far for IoU.
+        :param end_timeout: Seconds without a matching box that end a visit.
+        :param update_interval: Minimum seconds between update events; an
+            update is only sent when a better frame was seen.
+        :param min_hits: Matching boxes required before the start event, to
+            ignore single-frame false positives.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.end_timeout = end_timeout
+        self.update_interval = update_interval
+        self.min_hits = min_hits
+        self.visits = []
+
+    def update(self, source, boxes, confidences, frame, now=None):
+        """
+        Match the boxes of one inferred frame against the open visits.
+
+        :param source: Video source index of the frame.
+        :param boxes: Array (n, 4) of x, y, w, h in frame pixels.
+        :param confidences: Array (n,) of box confidences.
+        :param frame: Frame the boxes belong to (kept as best frame).
+        :return: List of VisitEvent.
+        """
+        now = time.monotonic() if now is None else now
+        events = []
+        open_visits = [visit for visit in self.visits if visit.source == source]
+        diagonal = float(np.hypot(frame.shape[1], frame.shape[0]))
+
+        # 依信心值由高到低貪婪配對
+        for i in np.argsort(-np.asarray(confidences)):
+            box = tuple(int(value) for value in boxes[i])
+            confidence = float(confidences[i])
+            visit = self._match(box, open_visits, diagonal)
+            if visit is None:
+                self.visits.append(Visit(source, box, confidence, frame, now))
+                continue
+            open_visits.remove(visit)
+            visit.observe(box, confidence, frame, now)
+
+        for visit in self.visits:
+            if visit.source != source or visit.last_seen != now:
+                continue
+            if not visit.started:
+                if visit.hits >= self.min_hits:
+                    visit.started = True
+                    events.append(visit.event(VISIT_START, now))
+            elif visit.best_pending and now - visit.last_event >= self.update_interval:
+                events.append(visit.event(VISIT_UPDATE, now))
+
+        events.extend(self.expire(now))
+        return events
+
+    def expire(self, now=None):
+        """
+        End visits not seen for ``end_timeout`` seconds; call periodically
+        even when nothing is inferred (e.g. while the motion gate is closed).
+
+        :return: List of VisitEvent.
+        """
+        now = time.monotonic() if now is None else now
+        events = []
+        remaining = []
+        for visit in self.visits:
+            if now - visit.last_seen < self.end_timeout:
+                remaining.append(visit)
+            elif visit.started:
+                events.append(visit.event(VISIT_END, now))
+        self.visits = remaining
+        return events
+
+    def _match(self, box, visits, diagonal):
+        if not visits:
+            return None
+        ious = box_iou(box, [visit.box for visit in visits])
+        best = int(np.argmax(ious))
+        if ious[best] >= self.iou_threshold:
+            return visits[best]
+
+        boxes = np.asarray([visit.box for visit in visits], dtype=np.float32)
+        centers = boxes[:, :2] + boxes[:, 2:] / 2
+        center = np.array([box[0] + box[2] / 2, box[1] + box[3] / 2])
+        distances = np.hypot(*(centers - center).T)
+        best = int(np.argmin(distances))
+        if distances[best] <= self.max_distance * diagonal:
+            return visits[best]
+        return None
@@ -0,0 +1,155 @@
+import time
+
+import cv2
+import numpy as np
+
+EMPTY_BOXES = np.empty((0, 4), dtype=np.int32)
+EMPTY_CONFIDENCES = np.empty(0, dtype=np.float32)
+
+# 無座標換算: 網路座標即為畫面座標 (input_w, input_h, scale_x, scale_y, pad_x, pad_y)
+IDENTITY_GEOMETRY = (1, 1, 1.0, 1.0, 0, 0)
+
+
+def decode_yolo_outputs(
+    outs,
+    class_id,
+    threshold,
+    geometry=IDENTITY_GEOMETRY,
+    nms_score_threshold=0.5,
+    nms_threshold=0.4,
+):
+    """
+    Turn raw YOLO (Darknet) outputs into boxes of a single class, vectorized.
+
+    Rows of all output layers are stacked, masked by the class score and the
+    arg-max class in one pass, scaled to frame pixels as array operations and
+    reduced with NMS.
+
+    :param outs: List of output arrays of shape (rows, 5 + classes) with
+        normalized center x, center y, width, height, objectness, scores.
+    :param class_id: Index of the class to keep (person = 0 in COCO).
+    :param threshold: Minimum class score.
+    :param geometry: ``(input_width, input_height, scale_x, scale_y, pad_x,
+        pad_y)`` mapping network pixels to frame pixels:
+        ``frame_x = (input_x - pad_x) / scale_x``.
+    :param nms_score_threshold: Score threshold passed to NMSBoxes.
+    :param nms_threshold: IoU threshold passed to NMSBoxes.
+    :return: ``(boxes, confidences)``: int32 array (n, 4) of x, y, w, h and
+        float32 array (n,), in output row order.
+    """
+    detections = outs[0] if len(outs) == 1 else np.concatenate(outs)
+    candidates = _select_class(detections[:, 5:], class_id, threshold)
+    if candidates.size == 0:
+        return EMPTY_BOXES, EMPTY_CONFIDENCES
+
+    rows = detections[candidates]
+    boxes = scale_boxes(rows[:, :4], geometry)
+    return _nms(boxes, rows[:, 5 + class_id], nms_score_threshold, nms_threshold)
+
+
+def decode_yolov8_outputs(
+    output,
+    class_id,
+    threshold,
+    input_size,
+    geometry=IDENTITY_GEOMETRY,
+    nms_score_threshold=0.5,
+    nms_threshold=0.4,
+):
+    """
+    Same as decode_yolo_outputs() for the raw output of an exported YOLOv8
+    (ultralytics ONNX) model, which has no objectness column and keeps
+    center x, center y, width, height in network input pixels.
+
+    :param output: Array of shape (4 + classes, rows) for one image.
+    :param input_size: ``(width, height)`` of the network input.
+    :return: ``(boxes, confidences)`` like decode_yolo_outputs().
+    """
+    candidates = _select_class(output[4:].T, class_id, threshold)
+    if candidates.size == 0:
+        return EMPTY_BOXES, EMPTY_CONFIDENCES
+
+    rows = output[:, candidates].T
+    in_w, in_h = input_size
+    xywh = rows[:, :4] / np.array([in_w, in_h, in_w, in_h], dtype=np.float32)
+    boxes = scale_boxes(xywh, geometry)
+    return _nms(boxes, rows[:, 4 + class_id], nms_score_threshold, nms_threshold)
+
+
+def scale_boxes(xywh, geometry=IDENTITY_GEOMETRY):
+    """
+    Map normalized center x, center y, width, height to frame pixels.
+
+    :param xywh: Array (n, 4), normalized to the network input.
+    :param geometry: See decode_yolo_outputs().
+    :return: int32 array (n, 4) of x, y, w, h.
+    """
+    in_w, in_h, scale_x, scale_y, pad_x, pad_y = geometry
+    if pad_x == 0 and pad_y == 0:
+        # 拉伸 (無補邊): 直接乘上畫面寬高, 與逐列計算 x * width 的結果一致
+        # (先乘網路尺寸再除以縮放比例會有浮點誤差, 取整後差 1 px)
+        frame_w, frame_h = round(in_w / scale_x), round(in_h / scale_y)
+        center_x = (xywh[:, 0] * frame_w).astype(np.int32)
+        center_y = (xywh[:, 1] * frame_h).astype(np.int32)
+        w = (xywh[:, 2] * frame_w).astype(np.int32)
+        h = (xywh[:, 3] * frame_h).astype(np.int32)
+    else:
+        center_x = ((xywh[:, 0] * in_w - pad_x) / scale_x).astype(np.int32)
+        center_y = ((xywh[:, 1] * in_h - pad_y) / scale_y).astype(np.int32)
+        w = (xywh[:, 2] * in_w / scale_x).astype(np.int32)
+        h = (xywh[:, 3] * in_h / scale_y).astype(np.int32)
+    x = (center_x - w / 2).astype(np.int32)
+    y = (center_y - h / 2).astype(np.int32)
+    return np.stack([x, y, w, h], axis=1)
+
+
+def _select_class(scores, class_id, threshold):
+    # 先以目標類別分數過濾, 只對少數候選列計算 argmax
+    candidates = np.flatnonzero(scores[:, class_id] > threshold)
+    if candidates.size:
+        candidates = candidates[scores[candidates].argmax(axis=1) == class_id]
+    return candidates
+
+
+def _nms(boxes, confidences, score_threshold, nms_threshold):
+    indexes = cv2.dnn.NMSBoxes(
+        boxes.tolist(), confidences.tolist(), score_threshold, nms_threshold
+    )
+    if len(indexes) == 0:
+        return EMPTY_BOXES, EMPTY_CONFIDENCES
+    keep = np.sort(np.asarray(indexes).reshape(-1))
+    return boxes[keep], confidences[keep]
+
+
+def merge_detections(boxes_list, confidences_list, nms_threshold=0.4):
+    """
+    Combine the boxes of several crops of one frame, suppressing duplicates
+    where the crops overlap.
+
+    :return: ``(boxes, confidences)`` like decode_yolo_outputs().
+    """
+    if len(boxes_list) == 1:
+        return boxes_list[0], confidences_list[0]
+    boxes = np.concatenate(boxes_list)
+    confidences = np.concatenate(confidences_list)
+    if len(boxes) < 2:
+        return boxes, confidences
+    return _nms(boxes, confidences, 0.0, nms_threshold)
+
+
+# Benchmark mode: python yolo_postprocess.py [rows] [iterations]
+if __name__ == "__main__":
+    import sys
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2535  # yolov4-tiny @ 416
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    rng = np.random.default_rng(0)
+    outs = [rng.random((rows, 85), dtype=np.float32) * 0.6]
+    geometry = (416, 416, 416 / 1920, 416 / 1080, 0, 0)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        decode_yolo_outputs(outs, 0, 0.5, geometry)
+    elapsed = time.perf_counter() - start
+    print(f"{rows} rows: {elapsed / iterations * 1000:.3f} ms per frame")
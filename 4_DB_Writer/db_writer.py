@@ -14,6 +14,19 @@ logger = setup_logger()
 # 載入 .env 檔案
 load_dotenv()
 
+# init.sql 之後新增的欄位, 啟動時補上舊版資料庫
+ADDED_COLUMNS = {
+    "boxes": "TEXT",
+    "visit_id": "TEXT",
+    "visit_event": "TEXT",
+    "visit_started": "TEXT",
+    "visit_duration": "REAL",
+    "source": "INTEGER",
+    "crop_path": "TEXT",
+}
+# 唯一索引 (索引名稱: 欄位); 每位訪客一筆資料, 以 visit_id upsert (NULL 不受限制)
+ADDED_INDEXES = {"idx_capture_log_visit_id": "visit_id"}
+
 
 class SQLiteHandler:
     def __init__(self, db_path=None):
@@ -34,6 +47,8 @@ class SQLiteHandler:
                 "Database path is not specified in .env or as a parameter."
             )
         self.conn = self.connect()
+        self.ensure_columns()
+        self.ensure_indexes()
         # self.enable_wal_mode()
 
     def connect(self):
@@ -49,6 +64,57 @@ class SQLiteHandler:
             logger.error(f"Error connecting to SQLite database: {e}")
             raise
 
+    def ensure_columns(self, table="capture_log", columns=None):
+        """
+        補上舊版資料庫缺少的欄位 (ALTER TABLE ADD COLUMN)
+        :param table: 資料表名稱
+        :param columns: 欄位名稱與型別, 預設為 ADDED_COLUMNS
+        """
+        columns = columns or ADDED_COLUMNS
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(f"PRAGMA table_info({table});")
+            existing = [row[1] for row in cursor.fetchall()]
+            if not existing:
+                return  # 資料表尚未建立 (由 init.sql 建立)
+            for name, column_type in columns.items():
+                if name not in existing:
+                    try:
+                        cursor.execute(
+                            f"ALTER TABLE {table} ADD COLUMN {name} {column_type};"
+                        )
+                    except sqlite3.OperationalError as e:
+                        # 多個寫入者同時啟動時, 欄位可能已由其他連線補上
+                        if "duplicate column" not in str(e):
+                            raise
+                        continue
+                    logger.info(f"Column {table}.{name} added.")
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error adding columns: {e}")
+            raise
+
+    def ensure_indexes(self, table="capture_log", indexes=None):
+        """
+        建立舊版資料庫缺少的唯一索引 (CREATE UNIQUE INDEX IF NOT EXISTS)
+        :param table: 資料表名稱
+        :param indexes: 索引名稱與欄位, 預設為 ADDED_INDEXES
+        """
+        indexes = indexes or ADDED_INDEXES
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(f"PRAGMA table_info({table});")
+            if not cursor.fetchall():
+                return  # 資料表尚未建立 (由 init.sql 建立)
+            for name, column in indexes.items():
+                cursor.execute(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({column});"
+                )
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error creating indexes: {e}")
+            raise
+
     def enable_wal_mode(self):
         """
         啟用 Write-Ahead Logging (WAL) 模式
@@ -0,0 +1,77 @@
+import base64
+import json
+import struct
+
+# 偵測事件格式 (Human Detector 與 DB Writer 各有一份相同的 event_codec.py)
+#   json:   舊格式, 圖片以 <名稱>_base64 欄位放在 JSON 內
+#   binary: MAGIC | 版本 (1 byte) | header 長度 (uint32, big endian)
+#           | header JSON | 圖片原始 bytes
+#           header 為事件欄位, 另以 "images": [[名稱, bytes 數], ...]
+#           描述其後的圖片
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+EVENT_FORMATS = (FORMAT_JSON, FORMAT_BINARY)
+
+MAGIC = b"WWHE"
+VERSION = 1
+_PREFIX = struct.Struct(">4sBI")
+
+
+def encode_event(fields, images, event_format=FORMAT_JSON):
+    """
+    :param fields: JSON-serializable event fields.
+    :param images: ``{name: JPEG bytes}``, e.g. ``img`` and ``crop``.
+    :param event_format: ``json`` (legacy, base64 images) or ``binary``.
+    :return: ``str`` for json, ``bytes`` for binary.
+    """
+    if event_format == FORMAT_JSON:
+        value = dict(fields)
+        for name, data in images.items():
+            value[f"{name}_base64"] = base64.b64encode(data).decode("utf-8")
+        return json.dumps(value)
+    if event_format != FORMAT_BINARY:
+        raise ValueError(f"Unknown event format: {event_format}")
+
+    header = dict(fields, images=[[name, len(data)] for name, data in images.items()])
+    header = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    return b"".join(
+        [_PREFIX.pack(MAGIC, VERSION, len(header)), header, *images.values()]
+    )
+
+
+def decode_event(value):
+    """
+    Decode an event of either format, so legacy JSON items queued before a
+    migration are still read.
+
+    :param value: Item from Redis (``bytes`` or ``str``).
+    :return: ``(fields, images)`` with ``images`` as ``{name: JPEG bytes}``.
+    """
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+
+    if not value.startswith(MAGIC):
+        fields = json.loads(value)
+        images = {
+            key[: -len("_base64")]: base64.b64decode(fields.pop(key))
+            for key in [key for key in fields if key.endswith("_base64")]
+            if fields[key]
+        }
+        return fields, images
+
+    if len(value) < _PREFIX.size:
+        raise ValueError("Truncated event")
+    _, version, header_size = _PREFIX.unpack_from(value)
+    if version > VERSION:
+        raise ValueError(f"Unsupported event version: {version}")
+    start = _PREFIX.size + header_size
+    fields = json.loads(value[_PREFIX.size : start])
+
+    images = {}
+    view = memoryview(value)
+    for name, size in fields.pop("images", []):
+        if start + size > len(value):
+            raise ValueError(f"Truncated event image: {name}")
+        images[name] = bytes(view[start : start + size])
+        start += size
+    return fields, images
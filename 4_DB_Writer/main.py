@@ -1,31 +1,119 @@
+import os
+import threading
+from functools import partial
+
 from config_loader import (
     load_config,
 )
 from db_writer import SQLiteHandler
 from logger import setup_logger
-from redis_consumer import RedisConsumer
-from util import convert_db_item, save_to_file
+from redis_consumer import TRANSPORT_STREAM, RedisConsumer
+from util import (
+    convert_db_item,
+    convert_event,
+    discard_images,
+    find_visit,
+    image_stored,
+    remove_image,
+    save_to_file,
+)
 
+# 同一訪客的事件可能由不同寫入執行緒同時處理, 查詢/寫入/清理圖檔需依序完成
+VISIT_LOCK = threading.Lock()
 
-def main():
-    try:
-        config = load_config()
-        logger = setup_logger()
-        logger.info(f"Starting {config['app']['name']} v{config['app']['version']}")
 
-        db_handler = SQLiteHandler()
-        consumer = RedisConsumer()
+def store_event(db_handler, item):
+    """
+    儲存一筆偵測事件的圖片並寫入 SQLite. stream 模式的事件可能重送,
+    以 entry ID 命名圖檔並略過已寫入的資料, 重送時結果相同
+    :param db_handler: SQLiteHandler
+    :param item: RedisConsumer 傳入的 (keyname, value[, entry ID])
+    """
+    data, images = convert_event(item)  # 解碼一次 (binary 或舊版 JSON)
+    entry_id = item[2] if len(item) > 2 else None
+    if data.get("visit_id"):
+        with VISIT_LOCK:
+            store_visit_event(db_handler, data, images, entry_id)
+        return
+    # 儲存圖片並取得檔名 (HD_PAYLOAD=both 時另有裁切圖)
+    file_name, crop_name = save_to_file(data, images, entry_id=entry_id)
+    if entry_id and image_stored(db_handler, file_name):
+        return  # 重送的事件前次已寫入, 只是尚未 XACK
+    insert_query, params = convert_db_item(data, file_name, crop_name)
+    db_handler.execute_query(insert_query, params)
+
+
+def store_visit_event(db_handler, data, images, entry_id=None):
+    """
+    訪客事件每位訪客一筆, 不論 start / update / end 的處理順序結果相同:
+    只存信心值高於已存入畫面的圖片, end 事件 (不帶圖片) 只更新停留時間
+    :param data: convert_event 解碼後的欄位
+    :param images: convert_event 解碼後的圖片
+    :param entry_id: stream entry ID (重送時圖檔名稱相同)
+    """
+    visit = find_visit(db_handler, data)
+    file_name = crop_name = None
+    confidence = float(data.get("predict_probability") or 0)
+    has_image = images or data.get("image_refs")
+    if has_image and (not visit or not visit[0] or confidence > (visit[3] or 0)):
+        file_name, crop_name = save_to_file(data, images, entry_id=entry_id)
+    else:
+        discard_images(data)  # 較差或重複的畫面 (舊版 end 事件也附圖片)
+    insert_query, params = convert_db_item(data, file_name, crop_name)
+    db_handler.execute_query(insert_query, params)
+
+    # 被較佳畫面取代, 或未被採用的圖檔
+    stored = find_visit(db_handler, data)
+    names = ((visit[0], visit[2]) if visit else ()) + (file_name, crop_name)
+    for name in names:
+        if name and name not in (stored[0], stored[2]):
+            remove_image(name)
 
-        def consumer_callback(item):
-            file_name = save_to_file(item)  # 儲存圖片並取得檔名
-            insert_query, params = convert_db_item(item, file_name)
-            db_handler.execute_query(insert_query, params)
 
-        consumer.listen(callback=consumer_callback)
+def run_writer(logger, consumer=None):
+    """
+    單一寫入流程: 自 REDIS 取得事件, 儲存圖片後寫入 SQLite
+    :param consumer: RedisConsumer, 預設依 .env 建立
+    """
+    db_handler = None
+    try:
+        db_handler = SQLiteHandler()
+        consumer = consumer or RedisConsumer()
+        consumer.listen(callback=partial(store_event, db_handler))
     except Exception as e:
         logger.error(f"Main process error: {e}")
     finally:
-        db_handler.close()
+        if db_handler:
+            db_handler.close()
+
+
+def main():
+    config = load_config()
+    logger = setup_logger()
+    logger.info(f"Starting {config['app']['name']} v{config['app']['version']}")
+
+    # stream 模式可同時執行多個寫入執行緒 (同一 consumer group, 各自的 SQLite 連線)
+    consumer = RedisConsumer()
+    workers = int(os.getenv("DBW_WORKERS", 1))
+    if consumer.transport != TRANSPORT_STREAM or workers <= 1:
+        run_writer(logger, consumer)
+        return
+
+    threads = [
+        threading.Thread(
+            target=run_writer,
+            args=(
+                logger,
+                RedisConsumer(consumer=f"{consumer.consumer}-{index}"),
+            ),
+            name=f"db-writer-{index}",
+        )
+        for index in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
 
 
 if __name__ == "__main__":
@@ -1,11 +1,24 @@
 import os
+import socket
+import time
 
 import redis
 from dotenv import load_dotenv
 
+from logger import setup_logger
+
 # 載入 .env 檔案
 load_dotenv()
 
+logger = setup_logger()
+
+TRANSPORT_LIST = "list"
+TRANSPORT_STREAM = "stream"
+TRANSPORTS = (TRANSPORT_LIST, TRANSPORT_STREAM)
+
+# Human Detector 以 XADD 寫入時的欄位名稱 (見 2_Human_Detector/redis_client.py)
+STREAM_FIELD = b"event"
+
 
 class RedisConsumer:
     def __init__(
@@ -15,32 +28,69 @@ class RedisConsumer:
         redis_list=None,
         timeout=0,
         redis_password=None,
+        transport=None,
+        group=None,
+        consumer=None,
+        count=None,
+        claim_idle=None,
+        max_deliveries=None,
     ):
         """
         初始化 RedisConsumer 物件
         :param redis_host: Redis 伺服器的主機名稱
         :param redis_port: Redis 伺服器的埠號
-        :param redis_list: 要監聽的 Redis list 名稱
-        :param timeout: blpop 的超時時間，0 表示無限等待
+        :param redis_list: 要監聽的 Redis list (或 stream) 名稱
+        :param timeout: blpop / xreadgroup 的超時時間 (秒)，0 表示無限等待
         :param redis_password: Redis 伺服器的密碼
+        :param transport: list (blpop, 只能有一個 DB Writer) 或 stream
+            (consumer group, 可同時執行多個 DB Writer, 寫入成功才 XACK)
+        :param group: stream 模式的 consumer group 名稱
+        :param consumer: 此 consumer 在 group 內的名稱, 預設為主機名稱-PID
+        :param count: stream 模式每次 xreadgroup 最多取得的筆數
+        :param claim_idle: 其他 consumer 取走但超過此毫秒數未 XACK 的資料
+            (例如行程中止) 會被接手處理
+        :param max_deliveries: 同一筆資料處理失敗達此次數後放棄 (XACK 並記錄)
         """
         self.redis_host = redis_host or os.getenv("DBW_REDIS_IP", "localhost")
         self.redis_port = redis_port or int(os.getenv("DBW_REDIS_PORT", 6379))
-        self.redis_list = redis_list or os.getenv("DBW_REDIS_QUEUE", "default_list")
+        self.transport = transport or os.getenv("DBW_REDIS_TRANSPORT", TRANSPORT_LIST)
+        if self.transport not in TRANSPORTS:
+            raise ValueError(f"Unknown Redis transport: {self.transport}")
+        # list 與 stream 使用不同的 key, 切換時舊 list 內的資料仍可由舊設定讀完
+        if self.transport == TRANSPORT_STREAM:
+            self.redis_list = redis_list or os.getenv(
+                "DBW_REDIS_STREAM", "visitor_stream"
+            )
+        else:
+            self.redis_list = redis_list or os.getenv("DBW_REDIS_QUEUE", "default_list")
         self.timeout = timeout or int(os.getenv("DBW_REDIS_BLPOP_TIMEOUT", 5))
         self.redis_password = redis_password or os.getenv("DBW_REDIS_PW", None)
+        self.group = group or os.getenv("DBW_REDIS_GROUP", "db_writer")
+        self.consumer = consumer or os.getenv(
+            "DBW_REDIS_CONSUMER", f"{socket.gethostname()}-{os.getpid()}"
+        )
+        self.count = count or int(os.getenv("DBW_REDIS_COUNT", 10))
+        self.claim_idle = claim_idle or int(os.getenv("DBW_REDIS_CLAIM_IDLE_MS", 60000))
+        self.max_deliveries = max_deliveries or int(
+            os.getenv("DBW_REDIS_MAX_DELIVERIES", 5)
+        )
         self.redis_client = redis.StrictRedis(
             host=self.redis_host,
             port=self.redis_port,
             password=self.redis_password,
-            decode_responses=True,
+            decode_responses=False,  # binary 事件含 JPEG 原始 bytes, 不可解碼為字串
         )
 
     def listen(self, callback=None):
         """
-        開始監聽 Redis list，使用 blpop 模式
-        :param callback: 處理資料的 Callback function
+        開始監聽 Redis list (blpop 模式) 或 stream (consumer group 模式)
+        :param callback: 處理資料的 Callback function, 收到 (keyname, value),
+            stream 模式為 (keyname, value, entry ID)
         """
+        if self.transport == TRANSPORT_STREAM:
+            self.listen_stream(callback)
+            return
+
         while True:
             # 使用 blpop 從 list 中取出資料
             item = self.redis_client.blpop(self.redis_list, timeout=self.timeout)
@@ -51,6 +101,100 @@ class RedisConsumer:
             if callback:
                 callback(item)  # 呼叫傳入的 Callback function
 
+    def listen_stream(self, callback=None):
+        """
+        以 consumer group 讀取 Redis stream: 每筆資料只交給 group 內一個
+        consumer, callback 成功後才 XACK; 未 XACK 的資料留在 pending 清單,
+        重新啟動或由其他 consumer 接手 (claim) 後再處理, 不會遺失.
+        同一筆資料可能處理多次, callback 需以 entry ID 確保結果只寫入一次
+        :param callback: 處理資料的 Callback function, 收到 (keyname, value, entry ID)
+        """
+        self.ensure_group()
+        # 先處理此 consumer 上次中止時尚未 XACK 的資料
+        self._read_group(callback, "0")
+        next_claim = 0.0
+        while True:
+            if time.monotonic() >= next_claim:
+                while self.claim_pending(callback):
+                    pass
+                next_claim = time.monotonic() + self.claim_idle / 2000
+            self._read_group(callback, ">", block=self.timeout * 1000)
+
+    def ensure_group(self):
+        """建立 consumer group (stream 不存在時一併建立), 已存在則略過"""
+        try:
+            self.redis_client.xgroup_create(
+                self.redis_list, self.group, id="0", mkstream=True
+            )
+            logger.info(f"Consumer group {self.group} created on {self.redis_list}")
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def claim_pending(self, callback=None):
+        """
+        接手超過 claim_idle 毫秒未 XACK 的資料 (包含中止的 consumer 所留下的),
+        處理失敗次數過多的資料則放棄, 避免無法寫入的資料一直重試
+        :return: 接手處理的筆數
+        """
+        pending = self.redis_client.xpending_range(
+            self.redis_list,
+            self.group,
+            min="-",
+            max="+",
+            count=self.count,
+            idle=self.claim_idle,
+        )
+        claim_ids = []
+        for entry in pending:
+            if entry["times_delivered"] >= self.max_deliveries:
+                self.redis_client.xack(self.redis_list, self.group, entry["message_id"])
+                logger.error(
+                    f"Dropped stream entry {entry['message_id']} after "
+                    f"{entry['times_delivered']} deliveries"
+                )
+            else:
+                claim_ids.append(entry["message_id"])
+        if not claim_ids:
+            return 0
+        entries = self.redis_client.xclaim(
+            self.redis_list, self.group, self.consumer, self.claim_idle, claim_ids
+        )
+        logger.info(f"Claimed {len(entries)} pending stream entries")
+        self._handle(callback, entries)
+        return len(entries)
+
+    def _read_group(self, callback, stream_id, block=None):
+        while True:
+            response = self.redis_client.xreadgroup(
+                self.group,
+                self.consumer,
+                {self.redis_list: stream_id},
+                count=self.count,
+                block=block,
+            )
+            entries = response[0][1] if response else []
+            self._handle(callback, entries)
+            # ">" 每次只讀一批; "0" 則讀到自己的 pending 清單結束為止
+            if stream_id == ">" or not entries:
+                return
+            stream_id = entries[-1][0]
+
+    def _handle(self, callback, entries):
+        for entry_id, fields in entries:
+            if not fields:
+                # 已被 MAXLEN 裁切的資料只剩 ID, 無法再處理
+                self.redis_client.xack(self.redis_list, self.group, entry_id)
+                continue
+            try:
+                if callback:
+                    callback((self.redis_list, fields[STREAM_FIELD], entry_id))
+            except Exception as e:
+                # 不 XACK, 留在 pending 清單, 超過 claim_idle 後重試
+                logger.error(f"Error handling stream entry {entry_id}: {e}")
+                continue
+            self.redis_client.xack(self.redis_list, self.group, entry_id)
+
 
 # 使用範例
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+# stream 重送: 寫入 SQLite 失敗一次後, 重送的事件仍可完整寫入 (不遺失圖片, 不重複)
+#   cd 4_DB_Writer && python -m unittest test_redelivery
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+import main
+import util
+from db_writer import SQLiteHandler
+from event_codec import encode_event
+from redis_consumer import STREAM_FIELD, RedisConsumer
+
+INIT_SQL = os.path.join(os.path.dirname(__file__), "..", "5_SQLite", "init.sql")
+
+
+class FakeStreamClient:
+    def __init__(self):
+        self.acked = []
+
+    def xack(self, stream, group, entry_id):
+        self.acked.append(entry_id)
+
+
+class FailingOnceHandler(SQLiteHandler):
+    """第一次 INSERT 失敗 (例如資料庫被鎖定), 之後正常寫入"""
+
+    failed = False
+
+    def execute_query(self, query, params=None, retries=5):
+        if "INSERT" in query and not self.failed:
+            self.failed = True
+            raise RuntimeError("Error executing query: database is locked")
+        return super().execute_query(query, params, retries)
+
+
+def _jpeg():
+    data = io.BytesIO()
+    Image.new("RGB", (32, 24)).save(data, format="JPEG")
+    return data.getvalue()
+
+
+class RedeliveryTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.img_folder = os.path.join(self.temp_dir.name, "img")
+        self.spool_folder = os.path.join(self.img_folder, ".spool")
+        os.makedirs(self.spool_folder)
+        self.db_path = os.path.join(self.temp_dir.name, "test.db")
+        with open(INIT_SQL, "r", encoding="utf-8") as f:
+            init_sql = f.read()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executescript(init_sql)
+
+        patches = [
+            mock.patch.object(util, "IMG_FOLDER", self.img_folder),
+            mock.patch.object(util, "SPOOL_FOLDER", self.spool_folder),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.db_handler = FailingOnceHandler(self.db_path)
+        self.addCleanup(self.db_handler.close)
+        self.addCleanup(self.temp_dir.cleanup)
+
+        self.consumer = RedisConsumer(transport="stream", consumer="test")
+        self.consumer.redis_client = FakeStreamClient()
+
+    def _deliver(self, value, entry_id=b"1700000000000-0"):
+        self.consumer._handle(
+            lambda item: main.store_event(self.db_handler, item),
+            [(entry_id, {STREAM_FIELD: value})],
+        )
+
+    def _rows(self):
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute("SELECT img_path FROM capture_log;").fetchall()
+
+    def _saved_images(self):
+        return sorted(
+            name
+            for _, _, names in os.walk(self.img_folder)
+            for name in names
+            if not name.startswith(".")
+        )
+
+    def _fields(self):
+        return {
+            "capture_datetime": "2026-10-18T10:00:00",
+            "predict_probability": "0.90",
+            "class_label": "person",
+        }
+
+    def test_claim_check_image_survives_failed_insert(self):
+        ref = "1700000000000000000_abcd1234_img.jpg"
+        with open(os.path.join(self.spool_folder, ref), "wb") as f:
+            f.write(_jpeg())
+        value = encode_event(dict(self._fields(), image_refs={"img": ref}), {})
+
+        self._deliver(value)
+        self.assertEqual(self.consumer.redis_client.acked, [])
+        self.assertEqual(self._rows(), [])
+
+        self._deliver(value)
+        self.assertEqual(self.consumer.redis_client.acked, [b"1700000000000-0"])
+        (img_path,) = self._rows()[0]
+        self.assertEqual(self._saved_images(), [img_path])
+        self.assertTrue(os.path.exists(util.image_path(img_path)))
+        self.assertEqual(os.listdir(self.spool_folder), [])
+
+    def test_embedded_image_written_once(self):
+        value = encode_event(self._fields(), {"img": _jpeg()}, "binary")
+
+        self._deliver(value)
+        self._deliver(value)
+        self.assertEqual(self.consumer.redis_client.acked, [b"1700000000000-0"])
+        (img_path,) = self._rows()[0]
+        self.assertEqual(self._saved_images(), [img_path])
+
+    def test_redelivery_after_insert_is_not_duplicated(self):
+        value = encode_event(self._fields(), {"img": _jpeg()}, "binary")
+        self.db_handler.failed = True  # INSERT 成功, 但 XACK 前中止
+
+        self._deliver(value)
+        self._deliver(value)
+        self.assertEqual(len(self._rows()), 1)
+        self.assertEqual(len(self._saved_images()), 1)
+
+    def _visit(self, kind, confidence, duration=0.0):
+        return dict(
+            self._fields(),
+            predict_probability=f"{confidence:.2f}",
+            visit_id="abc123",
+            visit_event=kind,
+            visit_started="2026-10-18T09:59:58",
+            visit_duration=duration,
+        )
+
+    def _visit_row(self):
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute(
+                "SELECT img_path, visit_event, predict_probability, visit_duration"
+                " FROM capture_log WHERE visit_id = 'abc123';"
+            ).fetchall()
+
+    def test_visit_events_out_of_order(self):
+        # 多個寫入執行緒: update 比 start 先寫入, end 不帶圖片
+        self.db_handler.failed = True
+        update = encode_event(self._visit("update", 0.95), {"img": _jpeg()}, "binary")
+        start = encode_event(self._visit("start", 0.80), {"img": _jpeg()}, "binary")
+        end = encode_event(self._visit("end", 0.95, 12.5), {}, "binary")
+
+        self._deliver(update, b"1700000000000-1")
+        self._deliver(start, b"1700000000000-0")
+        self._deliver(end, b"1700000000000-2")
+        ((img_path, event, confidence, duration),) = self._visit_row()
+        self.assertIn("1700000000000-1", img_path)
+        self.assertEqual((event, confidence, duration), ("end", 0.95, 12.5))
+        self.assertEqual(self._saved_images(), [img_path])
+
+    def test_visit_end_before_start(self):
+        self.db_handler.failed = True
+        end = encode_event(self._visit("end", 0.80, 4.0), {}, "binary")
+        start = encode_event(self._visit("start", 0.80), {"img": _jpeg()}, "binary")
+
+        self._deliver(end, b"1700000000000-1")
+        self._deliver(start, b"1700000000000-0")
+        ((img_path, event, _, duration),) = self._visit_row()
+        self.assertEqual((event, duration), ("end", 4.0))
+        self.assertEqual(self._saved_images(), [img_path])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
-import base64
+import errno
 import json
 import os
+import shutil
 import uuid
 from datetime import datetime
 from PIL import Image
@@ -14,74 +15,211 @@ load_dotenv()
 from config_loader import (
     load_config,
 )
+from event_codec import decode_event
 from logger import setup_logger
 
 config = load_config()
 logger = setup_logger()
 
+# 圖檔資料夾 (容器內掛載路徑), 依日期分資料夾存放
+IMG_FOLDER = "/app/img"
+# claim-check 暫存目錄 (Human Detector 的 HD_IMAGE_SPOOL),
+# 預設位於圖檔資料夾內以便直接搬移
+SPOOL_FOLDER = os.getenv("DBW_IMAGE_SPOOL", "/app/img/.spool")
 
-def convert_json(item):
+# 訪客事件 (Human Detector 的 visit_tracker)
+VISIT_START = "start"
+VISIT_UPDATE = "update"
+VISIT_END = "end"
+
+
+def convert_event(item):
     """
-    將 REDIS傳入資料轉為JSON格式
+    將 REDIS傳入資料解碼 (binary 格式或舊版 JSON 格式), 每筆資料只解碼一次
+    :param item: blpop 取得的 (keyname, value), 或 stream 的 (keyname, value, entry ID)
+    :return: (欄位 dict, {圖片名稱: JPEG bytes})
     """
     try:
-        keyname, value = item  # 解構 tuple，取得 keyname 和 JSON 字串
-        data = json.loads(value)  # 將 JSON 字串轉換為字典
-        return data
+        keyname, value = item[:2]  # 解構 tuple，取得 keyname 和資料
+        return decode_event(value)
     except (ValueError, KeyError, json.JSONDecodeError) as e:
         logger.error(f"Error converting item: {e}")
         raise RuntimeError(f"Error converting item: {e}")
 
 
-def convert_db_item(item, filename):
+def convert_db_item(data, filename, crop_filename=None):
     """
     將資料轉換為 SQLite 插入語法所需的參數
-    :param item: Tuple 格式資料，例如 ('visitor_queue', '{"capture_datetime": "...", "img_base64": "...", "img_path": "...", "predict_probability": "..."}')
+    :param data: convert_event 解碼後的欄位，例如 {"capture_datetime": "...",
+        "predict_probability": "...", "class_label": "..."}
+    :param crop_filename: 人形裁切圖檔名 (HD_PAYLOAD=both)
     :return: SQL 插入語法字串和對應的參數
     """
-    data = convert_json(item)  # 將 JSON 字串轉換為字典
-    insert_query = """
-    INSERT INTO capture_log (capture_datetime, img_base64, img_path, predict_probability, class_label) 
-    VALUES (?, ?, ?, ?, ?);
+    # 訪客事件每位訪客一筆 (visit_id 唯一), 多個寫入執行緒時到達順序不固定:
+    # 圖片只換成信心值較高的畫面, 事件狀態只會 start -> update -> end 前進;
+    # 一般偵測事件 visit_id 為 NULL, 不會衝突, 每筆新增
+    better = (
+        "excluded.img_path IS NOT NULL AND (img_path IS NULL"
+        " OR excluded.predict_probability > predict_probability)"
+    )
+    insert_query = f"""
+    INSERT INTO capture_log (capture_datetime, img_base64, img_path,
+        predict_probability, class_label, boxes, visit_id, visit_event,
+        visit_started, visit_duration, source, crop_path)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(visit_id) DO UPDATE SET
+        capture_datetime = MIN(capture_datetime, excluded.capture_datetime),
+        img_path = CASE WHEN {better} THEN excluded.img_path ELSE img_path END,
+        crop_path = CASE WHEN {better} THEN excluded.crop_path ELSE crop_path END,
+        boxes = CASE WHEN {better} THEN excluded.boxes ELSE boxes END,
+        predict_probability = CASE WHEN {better}
+            THEN excluded.predict_probability ELSE predict_probability END,
+        visit_event = CASE
+            WHEN '{VISIT_END}' IN (visit_event, excluded.visit_event)
+                THEN '{VISIT_END}'
+            WHEN '{VISIT_UPDATE}' IN (visit_event, excluded.visit_event)
+                THEN '{VISIT_UPDATE}'
+            ELSE excluded.visit_event END,
+        visit_duration = MAX(IFNULL(visit_duration, 0), excluded.visit_duration);
     """
+    # 人框座標 (相對於圖片寬高), 圖片本身不含標註, 由檢視端繪製; 舊格式資料沒有此欄位
+    boxes = data.get("boxes")
     params = (
         data.get("capture_datetime"),
-        "", # 暫不儲存 節省空間 data.get("img_base64")
+        "",  # 暫不儲存 節省空間 (圖片存為檔案)
         filename,
         data.get("predict_probability"),
         data.get("class_label"),  # 預設為 None，如果沒有提供 note
+        json.dumps(boxes) if boxes is not None else None,
+        data.get("visit_id"),
+        data.get("visit_event"),
+        data.get("visit_started"),
+        data.get("visit_duration"),
+        data.get("source"),
+        crop_filename,
     )
     return insert_query, params
 
 
-def save_to_file(item, max_width=1024, max_height=1024):
+def find_visit(db_handler, data):
+    """
+    :param db_handler: SQLiteHandler
+    :param data: convert_event 解碼後的欄位
+    :return: 此訪客已存入的 (img_path, visit_event, crop_path, predict_probability),
+        非訪客事件或尚未存入時為 None
+    """
+    visit_id = data.get("visit_id")
+    if not visit_id:
+        return None
+    rows = db_handler.execute_query(
+        "SELECT img_path, visit_event, crop_path, predict_probability"
+        " FROM capture_log WHERE visit_id = ?;",
+        (visit_id,),
+    )
+    return rows[0] if rows else None
+
+
+def image_stored(db_handler, filename):
+    """:return: 已有資料引用此圖檔 (重送的事件已寫入過)"""
+    rows = db_handler.execute_query(
+        "SELECT 1 FROM capture_log WHERE img_path = ? LIMIT 1;", (filename,)
+    )
+    return bool(rows)
+
+
+def image_path(filename):
+    """圖檔的完整路徑 (檔名以日期開頭, 存放於同日期的資料夾)"""
+    return os.path.join(IMG_FOLDER, filename.split("_")[0], filename)
+
+
+def remove_image(filename):
+    """刪除已不再被資料庫引用的圖檔 (例如被較佳畫面取代)"""
+    path = image_path(filename)
+    if os.path.exists(path):
+        os.remove(path)
+        logger.info(f"Image removed: {path}")
+
+
+def discard_images(data):
+    """刪除事件在 claim-check 暫存目錄中的圖片 (不入庫的事件)"""
+    for ref in (data.get("image_refs") or {}).values():
+        path = spool_path(ref)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def move_file(src, dst):
+    """
+    搬移檔案; 不同檔案系統時先複製為暫存檔再改名, 避免產生寫到一半的圖檔
+    """
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        temp_path = f"{dst}.tmp"
+        shutil.copyfile(src, temp_path)
+        os.replace(temp_path, dst)
+        os.remove(src)
+
+
+def spool_path(ref):
     """
-    取出 BASE64 轉為 JPG 圖檔，若尺寸過大會自動縮小，然後儲存至指定路徑。
+    claim-check 圖片在暫存目錄中的路徑 (只接受檔名, 避免路徑穿越)
+    :param ref: Human Detector 寫入暫存目錄的檔名
     """
-    data = convert_json(item)  # 將 JSON 字串轉換為字典
+    if not ref or os.path.basename(ref) != ref or ref.startswith("."):
+        raise ValueError(f"Invalid image reference: {ref}")
+    return os.path.join(SPOOL_FOLDER, ref)
 
-    # Step 1: 解碼 base64 並轉為 PIL 圖片
-    img_base64 = data.get("img_base64")
-    if not img_base64:
-        raise ValueError("img_base64 is missing")
+
+def _load_image(name, data, images, max_width, max_height):
+    """
+    取出事件中的一張 JPEG (或暫存目錄中的圖檔) 並檢查尺寸, 過大時縮小
+    :param name: 圖片名稱 (img / crop)
+    :return: (JPEG bytes, 暫存目錄中的檔案路徑); 不需縮小的暫存圖檔 bytes 為 None
+    """
+    img_data = images.get(name)
+    refs = data.get("image_refs") or {}
+    spool_file = None
+    if not img_data and refs.get(name):
+        spool_file = spool_path(refs[name])
+        if not os.path.exists(spool_file):
+            raise ValueError(f"Spooled image not found: {spool_file}")
+    elif not img_data:
+        raise ValueError(f"{name} is missing")
 
     try:
-        img_data = base64.b64decode(img_base64)
-        image = Image.open(io.BytesIO(img_data))
+        image = Image.open(spool_file or io.BytesIO(img_data))
 
-        # 自動調整圖片尺寸（維持比例）
+        # 自動調整圖片尺寸（維持比例）, 轉回 bytes 格式以便寫入檔案
         if image.width > max_width or image.height > max_height:
             image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
-
-        # 轉回 bytes 格式以便寫入檔案
-        img_bytes_io = io.BytesIO()
-        image.save(img_bytes_io, format="JPEG")
-        img_data = img_bytes_io.getvalue()
+            img_bytes_io = io.BytesIO()
+            image.save(img_bytes_io, format="JPEG")
+            img_data = img_bytes_io.getvalue()
+        image.close()
     except Exception as e:
         logger.error(f"Failed to decode or resize image: {e}")
         raise ValueError(f"Invalid image data or base64 input: {e}")
+    return img_data, spool_file
+
+
+def save_to_file(data, images, max_width=1024, max_height=1024, entry_id=None):
+    """
+    將 JPEG 圖片儲存至指定路徑，若尺寸過大會自動縮小 (未超過時直接寫入, 不重新編碼)。
+    claim-check 事件 (image_refs) 的圖片則由暫存目錄直接搬移。
+    HD_PAYLOAD=both 時另有人形裁切圖 (crop), 存為同名加上 _crop 的檔案。
+    :param data: convert_event 解碼後的欄位
+    :param images: convert_event 解碼後的圖片 {名稱: JPEG bytes}
+    :param entry_id: stream entry ID; 檔名由此產生, 重送的事件對應同一檔案,
+        已存在時不再寫入 (暫存圖檔已於前次搬移)
+    :return: (圖檔檔名, 裁切圖檔名 或 None)
+    """
+    refs = data.get("image_refs") or {}
+    names = ["img"] + (["crop"] if images.get("crop") or refs.get("crop") else [])
 
-    # Step 2: 解析時間戳
+    # Step 1: 解析時間戳
     capture_datetime = data.get("capture_datetime")
     if not capture_datetime:
         logger.error("capture_datetime is missing in the input data.")
@@ -92,23 +230,39 @@ def save_to_file(item, max_width=1024, max_height=1024):
         logger.error("Invalid capture_datetime format. Expected ISO 8601 format.")
         raise ValueError("Invalid capture_datetime format. Expected ISO 8601 format.")
 
-    # Step 3: 檔案命名與儲存路徑
+    # Step 2: 檔案命名與儲存路徑
     timestamp = capture_time.strftime("%Y%m%d_%H%M%S_%f")[:-3]
-    short_uuid = str(uuid.uuid4())[:5]
+    if isinstance(entry_id, bytes):
+        entry_id = entry_id.decode("utf-8")
+    short_uuid = entry_id or str(uuid.uuid4())[:5]
     class_label = data.get("class_label", "unknown")
-    filename = f"{timestamp}_{class_label}_{short_uuid}.jpg"
-
-    base_folder = "/app/img"
-    date_folder = capture_time.strftime("%Y%m%d")
-    save_path = os.path.join(base_folder, date_folder)
-    os.makedirs(save_path, exist_ok=True)
-
-    file_path = os.path.join(save_path, filename)
+    filenames = {
+        name: f"{timestamp}_{class_label}_{short_uuid}"
+        + ("" if name == "img" else f"_{name}")
+        + ".jpg"
+        for name in names
+    }
 
-    # Step 4: 儲存圖片
-    with open(file_path, "wb") as img_file:
-        img_file.write(img_data)
+    # Step 3: 取出 JPEG (或暫存目錄中的圖檔) 並檢查尺寸, 儲存圖片
+    # (claim-check 且不需縮小時直接搬移, 同一檔案系統為原子操作)
+    for name in names:
+        file_path = image_path(filenames[name])
+        if os.path.exists(file_path):
+            logger.info(f"Image already saved: {file_path}")
+            continue
+        img_data, spool_file = _load_image(name, data, images, max_width, max_height)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if spool_file and not img_data:
+            move_file(spool_file, file_path)
+        else:
+            # 先寫入暫存檔再改名, 中止時不會留下寫到一半 (重送時被略過) 的圖檔
+            temp_path = f"{file_path}.tmp"
+            with open(temp_path, "wb") as img_file:
+                img_file.write(img_data)
+            os.replace(temp_path, file_path)
+        logger.info(f"Image saved to {file_path}")
+        print(f"Image saved to {file_path}")
 
-    logger.info(f"Image saved to {file_path}")
-    print(f"Image saved to {file_path}")
-    return filename
+    # 其餘未入庫的暫存圖片一併移除
+    discard_images(data)
+    return filenames["img"], filenames.get("crop")
@@ -4,5 +4,14 @@ CREATE TABLE IF NOT EXISTS capture_log (
     img_base64 TEXT,                         -- base64 編碼圖片
     img_path TEXT,                           -- 儲存的圖片路徑（如 /images/xxx.jpg）
     predict_probability REAL,                -- 預測機率百分比 (例如 10.5 表示 10.5%)
-    class_label TEXT                         -- 分類說明
-);
\ No newline at end of file
+    class_label TEXT,                        -- 分類說明
+    boxes TEXT,                              -- 人框 JSON [[x, y, w, h, 信心值], ...], 座標為圖片寬高比例 (0~1)
+    visit_id TEXT,                           -- 訪客編號 (訪客追蹤模式, 每位訪客一筆)
+    visit_event TEXT,                        -- 最後收到的訪客事件 (start / update / end)
+    visit_started TEXT,                      -- 訪客出現時間 (ISO 8601)
+    visit_duration REAL,                     -- 停留秒數 (end 事件時更新)
+    source INTEGER,                          -- 攝影機編號
+    crop_path TEXT                           -- 人形裁切圖路徑 (HD_PAYLOAD=both)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_capture_log_visit_id ON capture_log (visit_id);
\ No newline at end of file
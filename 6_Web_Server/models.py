@@ -12,6 +12,14 @@ class CaptureLog(db.Model):
     img_path = db.Column(db.String)
     predict_probability = db.Column(db.Float)  # REAL → Float
     class_label = db.Column(db.String)
+    boxes = db.Column(db.Text)  # 人框 JSON, 座標為圖片寬高比例
+    # 訪客追蹤模式: 每位訪客一筆, 圖片為停留期間的最佳畫面
+    visit_id = db.Column(db.String)
+    visit_event = db.Column(db.String)
+    visit_started = db.Column(db.String)
+    visit_duration = db.Column(db.Float)
+    source = db.Column(db.Integer)
+    crop_path = db.Column(db.String)  # 人形裁切圖 (HD_PAYLOAD=both)
 
     def to_dict(self):
         return {
@@ -21,4 +29,11 @@ class CaptureLog(db.Model):
             "img_path": self.img_path,
             "predict_probability": self.predict_probability,
             "class_label": self.class_label,
+            "boxes": self.boxes,
+            "visit_id": self.visit_id,
+            "visit_event": self.visit_event,
+            "visit_started": self.visit_started,
+            "visit_duration": self.visit_duration,
+            "source": self.source,
+            "crop_path": self.crop_path,
         }
@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 
 from env_config import Config
@@ -37,6 +38,11 @@ def service_query_capture_log(resquest):
             CaptureLog.img_path,
             CaptureLog.predict_probability,
             CaptureLog.class_label,
+            CaptureLog.boxes,
+            CaptureLog.visit_id,
+            CaptureLog.visit_duration,
+            CaptureLog.source,
+            CaptureLog.crop_path,
         )
         .filter(
             CaptureLog.capture_datetime >= start_dt_iso,
@@ -62,6 +68,14 @@ def service_query_capture_log(resquest):
             "img_path": img_path_combiner(r.img_path),
             "predict_probability": r.predict_probability,
             "class_label": r.class_label,
+            # 人框 [[x, y, w, h, 信心值], ...] (圖片寬高比例), 由 APP 於顯示時繪製
+            "boxes": json.loads(r.boxes) if r.boxes else [],
+            # 訪客追蹤模式才有值: 訪客編號, 停留秒數 (離開後才有), 攝影機編號
+            "visit_id": r.visit_id,
+            "visit_duration": r.visit_duration,
+            "source": r.source,
+            # 人形裁切圖 (HD_PAYLOAD=both 才有)
+            "crop_path": img_path_combiner(r.crop_path) if r.crop_path else None,
         })
 
     return make_response(ReturnCode.SUCCESS, resultList=result_list), 200